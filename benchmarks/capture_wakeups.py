@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Wakeups of the key listener per minute of simulated play, for the record and
+# the grab capture mode. Play is faked with XTEST on a private Xvfb: mouse
+# movement and clicks, keys that aren't duplicated and some that are.
+#
+#   python benchmarks/capture_wakeups.py -s 20
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import subprocess
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+STANDIN = os.path.join(HERE, "standin.py")
+KEYS_ALLOWED = ["1", "2", "3", "q", "e"]
+KEYS_OTHER = ["w", "a", "s", "d", "t", "Tab"]
+
+
+def play(disp, seconds):
+    from Xlib import X, XK
+    from Xlib.ext import xtest
+
+    allowed = [disp.keysym_to_keycode(XK.string_to_keysym(k)) for k in KEYS_ALLOWED]
+    other = [disp.keysym_to_keycode(XK.string_to_keysym(k)) for k in KEYS_OTHER]
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        # mostly movement and mouse look, now and then an ability
+        for i in range(20):
+            xtest.fake_input(disp, X.MotionNotify, x=random.randint(0, 500), y=300)
+        xtest.fake_input(disp, X.ButtonPress, 3)
+        xtest.fake_input(disp, X.ButtonRelease, 3)
+        keycode = random.choice(other if random.random() < 0.7 else allowed)
+        xtest.fake_input(disp, X.KeyPress, keycode)
+        xtest.fake_input(disp, X.KeyRelease, keycode)
+        disp.flush()
+        time.sleep(0.05)
+
+
+def run(mode, seconds):
+    from Xlib.display import Display
+    from brawler.input import duplicator
+    from brawler.window import wait_for_window
+
+    master = subprocess.Popen(
+        [sys.executable, STANDIN, "client_0", "wow.exe", "640", "480"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        desktop = wait_for_window("client_0", timeout=10)
+        disp = Display()
+        disp.set_input_focus(desktop, 0, 0)
+        disp.sync()
+
+        client = SimpleNamespace(
+            name="client_0", virtual_desktop=desktop, injector=None
+        )
+        dup = duplicator([client], KEYS_ALLOWED, capture=mode)
+        listener = threading.Thread(target=dup.run, daemon=True)
+        listener.start()
+        time.sleep(0.5)
+
+        start = dup.wakeups
+        play(disp, seconds)
+        wakeups = dup.wakeups - start
+        dup.stop()
+        listener.join()
+        return wakeups * 60 / seconds, dup.recorded
+    finally:
+        master.terminate()
+        master.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="capture mode wakeup benchmark")
+    parser.add_argument("-s", "--seconds", help="seconds of play", type=int, default=20)
+    args = parser.parse_args()
+
+    from xvfb import xvfb
+
+    with xvfb():
+        for mode in ("record", "grab"):
+            per_minute, keys = run(mode, args.seconds)
+            print(
+                "{:6} {:10.0f} wakeups/min, {} keys duplicated".format(
+                    mode, per_minute, keys
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
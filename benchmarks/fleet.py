@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Launch, layout and key fan-out benchmark against stand-in clients on Xvfb.
+#
+#   python benchmarks/fleet.py                 # 5, 10, 20 and 40 toons
+#   python benchmarks/fleet.py -t 10 -o a.json
+#   python benchmarks/fleet.py -t 40 -x 4      # toons spread over 4 more displays
+#   python benchmarks/fleet.py -L DEBUG        # fan-out with debug logging on
+#
+# Every toon count runs in its own process with a fresh Xvfb server, results
+# are written as JSON (default: benchmarks/results/<commit>.json) so runs can
+# be compared across commits.
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+STANDIN = os.path.join(HERE, "standin.py")
+TOONS = (5, 10, 20, 40)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        "mean": sum(samples) / len(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "p99": samples[min(int(len(samples) * 0.99), len(samples) - 1)],
+        "max": samples[-1],
+    }
+
+
+def standins():
+    # controller and client classes that start stand-in windows instead of wine,
+    # created on demand so brawler is only imported once DISPLAY is set
+    from brawler.api import brawler_client, brawler_controller
+
+    class standin_client(brawler_client):
+        def open(self):
+            self.started = time.monotonic()
+            self.arrivals = queue.Queue()
+            self.proc = subprocess.Popen(
+                [
+                    sys.executable,
+                    STANDIN,
+                    self.name,
+                    os.path.basename(self.executable),
+                    str(int(self.resolution_x)),
+                    str(int(self.resolution_y)),
+                ],
+                stdout=subprocess.PIPE,
+                text=True,
+                env=self.environment,
+                start_new_session=True,
+            )
+            self.pgid = self.proc.pid
+            threading.Thread(target=self.read, daemon=True).start()
+
+        def read(self):
+            for line in self.proc.stdout:
+                self.arrivals.put(float(line.split()[1]))
+
+        def wait_for_virtual_desktop(self, timeout=30):
+            result = super().wait_for_virtual_desktop(timeout)
+            self.discovery = time.monotonic() - self.started
+            return result
+
+        def destroy(self):
+            self.proc.terminate()
+            self.proc.wait()
+
+    class standin_controller(brawler_controller):
+        client_class = standin_client
+
+    return standin_client, standin_controller
+
+
+def run(toons, keys, burst, backend, displays=(), loglevel=None):
+    from Xlib import X, XK
+    from Xlib.ext import xtest
+    from Xlib.display import Display
+    from brawler.api import brawler_config
+    from brawler.input import duplicator
+    from brawler.telemetry import sampler
+    from brawler.logging import set_level
+    from brawler.window import flush, get_display
+
+    if loglevel:
+        set_level(loglevel)
+    standin_client, standin_controller = standins()
+
+    conf = {
+        "accounts": {"master": None, "toons": []},
+        "executable": "wow.exe",
+        "wine_bin": "wine",
+        "wine_prefix_base": tempfile.gettempdir(),
+        "keys_allowed": ["1"],
+        "input_backend": backend,
+        "launch_settle": 0,
+        "launch_concurrency": toons + 1,
+        # the master stays on the default display, toons are dealt round robin
+        "displays": {
+            d: list(range(i + 1, toons + 1, len(displays)))
+            for i, d in enumerate(displays)
+        },
+    }
+    config = brawler_config(conf, SimpleNamespace(toons=toons, dual_monitor=False))
+    ctrl = standin_controller(config)
+
+    result = {"toons": toons, "displays": len(displays) + 1}
+    try:
+        start = time.perf_counter()
+        ctrl.launch_clients()
+        for c in ctrl.clients:
+            c.wait_for_window()
+        result["launch_seconds"] = time.perf_counter() - start
+        result["discovery_seconds"] = percentiles([c.discovery for c in ctrl.clients])
+
+        start = time.perf_counter()
+        layout = {l[0]: l for l in ctrl.layout()}
+        for c in ctrl.clients:
+            id, res_x, res_y, x, y = layout[c.id]
+            c.resolution_x, c.resolution_y = res_x, res_y
+            c.windowsize()
+            c.windowmove(x, y)
+        flush()
+        for d in [None] + list(displays):
+            get_display(d).sync()
+        result["layout_seconds"] = time.perf_counter() - start
+
+        # cost of one telemetry pass over /proc for the whole fleet
+        telemetry = sampler(lambda: ctrl.clients)
+        samples = []
+        for i in range(20):
+            samples.append(telemetry.sample()["sample_seconds"])
+        result["telemetry_sample_seconds"] = percentiles(samples)
+
+        toon_clients = ctrl.clients[1:]
+        dup = duplicator(ctrl.clients, ["1"], max(burst, 64), "block")
+        listener = threading.Thread(target=dup.run, daemon=True)
+        listener.start()
+
+        # physical key presses are faked with XTEST, so they go all the way
+        # through the record context, the duplicator and the injection
+        keyboard = Display()
+        keycode = keyboard.keysym_to_keycode(XK.string_to_keysym("1"))
+
+        def press():
+            xtest.fake_input(keyboard, X.KeyPress, keycode)
+            xtest.fake_input(keyboard, X.KeyRelease, keycode)
+            keyboard.flush()
+
+        # one key at a time, latency from the key press to arrival at every toon
+        time.sleep(0.5)
+        latencies = []
+        for i in range(keys):
+            pressed = time.perf_counter()
+            press()
+            for c in toon_clients:
+                latencies.append(c.arrivals.get(timeout=10) - pressed)
+        result["fanout_latency_seconds"] = percentiles(latencies)
+
+        # a burst of keys as fast as possible
+        start = time.perf_counter()
+        for i in range(burst):
+            press()
+        for c in toon_clients:
+            for i in range(burst):
+                c.arrivals.get(timeout=10)
+        elapsed = time.perf_counter() - start
+        result["fanout_keys_per_second"] = burst * len(toon_clients) / elapsed
+
+        dup.stop()
+        listener.join()
+        dup.fanout.stop()
+    finally:
+        for c in ctrl.clients:
+            c.destroy()
+        for injector in ctrl.injectors.values():
+            if hasattr(injector, "stop"):
+                injector.stop()
+
+    return result
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="brawler fleet benchmark")
+    parser.add_argument("-t", "--toons", type=int, action="append")
+    parser.add_argument("-k", "--keys", help="keys for latency", type=int, default=100)
+    parser.add_argument("-b", "--burst", help="keys per burst", type=int, default=200)
+    parser.add_argument("--backend", help="input backend", default="xlib")
+    parser.add_argument(
+        "-x", "--displays", help="extra displays for toons", type=int, default=0
+    )
+    parser.add_argument("-L", "--loglevel", help="log level during the run")
+    parser.add_argument("-o", "--output", help="json result file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        from xvfb import xvfb
+
+        extra = [xvfb(export=False) for i in range(args.displays)]
+        with xvfb():
+            try:
+                displays = [x.start() for x in extra]
+                result = run(
+                    args.child,
+                    args.keys,
+                    args.burst,
+                    args.backend,
+                    displays,
+                    args.loglevel,
+                )
+            finally:
+                for x in extra:
+                    x.stop()
+        print(json.dumps(result))
+        return
+
+    results = []
+    for toons in args.toons or TOONS:
+        out = subprocess.check_output(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                str(toons),
+                "-k",
+                str(args.keys),
+                "-b",
+                str(args.burst),
+                "--backend",
+                args.backend,
+                "--displays",
+                str(args.displays),
+            ]
+            + (["--loglevel", args.loglevel] if args.loglevel else []),
+            text=True,
+        )
+        result = json.loads(out.splitlines()[-1])
+        print(
+            "{:3} toons: launch {:.2f}s, layout {:.1f}ms, fan-out p95 {:.2f}ms, "
+            "{:.0f} keys/s".format(
+                toons,
+                result["launch_seconds"],
+                result["layout_seconds"] * 1000,
+                result["fanout_latency_seconds"]["p95"] * 1000,
+                result["fanout_keys_per_second"],
+            )
+        )
+        results.append(result)
+
+    from import_time import measure_all
+
+    imports = measure_all()
+    print(
+        "import: "
+        + ", ".join("{} {:.1f}ms".format(m, t * 1000) for m, t in imports.items())
+    )
+
+    sha = commit()
+    output = args.output or os.path.join(HERE, "results", "{}.json".format(sha))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "commit": sha,
+                "date": datetime.datetime.now().isoformat(),
+                "backend": args.backend,
+                "displays": args.displays + 1,
+                "import_seconds": imports,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print("results written to {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Import time of the brawler modules, measured with python -X importtime in a
+# fresh interpreter each.
+#
+#   python benchmarks/import_time.py
+
+import os
+import sys
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("brawler", "brawler.config", "brawler.cli", "brawler.api")
+
+
+def measure(module):
+    # returns the cumulative import time of module in seconds
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        cwd=os.path.dirname(HERE),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stderr
+    for line in out.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000000
+    return None
+
+
+def measure_all():
+    return {module: measure(module) for module in MODULES}
+
+
+def main():
+    for module, seconds in measure_all().items():
+        print("{:16} {:8.1f}ms".format(module, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
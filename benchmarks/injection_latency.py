@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compare key injection latency of the xdotool and xlib input backends.
+# Needs a running X server, e.g.: Xvfb :99 & DISPLAY=:99 python benchmarks/injection_latency.py
+
+import time
+import argparse
+import statistics
+
+from Xlib import X
+from Xlib.display import Display
+
+from brawler.inject import get_injector
+
+
+def create_window(disp):
+    screen = disp.screen()
+    window = screen.root.create_window(
+        0,
+        0,
+        64,
+        64,
+        0,
+        screen.root_depth,
+        event_mask=X.KeyPressMask,
+    )
+    window.set_wm_name("brawler_bench")
+    window.map()
+    disp.sync()
+    return window
+
+
+def measure(injector, disp, window, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        injector.send_key(window.id, "1")
+        # wait for the key press to arrive at the window
+        while True:
+            event = disp.next_event()
+            if event.type == X.KeyPress:
+                break
+        samples.append((time.perf_counter() - start) * 1000)
+        # drain the key release
+        while disp.pending_events():
+            disp.next_event()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="key injection latency benchmark")
+    parser.add_argument("-n", "--count", help="keys per backend", type=int, default=200)
+    args = parser.parse_args()
+
+    disp = Display()
+    window = create_window(disp)
+
+    for backend in ("xdotool", "xlib"):
+        injector = get_injector(backend)
+        samples = sorted(measure(injector, disp, window, args.count))
+        print(
+            "{:8} mean {:7.3f}ms  p50 {:7.3f}ms  p95 {:7.3f}ms  max {:7.3f}ms".format(
+                backend,
+                statistics.mean(samples),
+                samples[len(samples) // 2],
+                samples[int(len(samples) * 0.95)],
+                samples[-1],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
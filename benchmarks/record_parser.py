@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Micro benchmark of the record reply parser on synthetic replies, compared to
+# parsing every event with Xlib like the duplicator used to.
+#
+#   python benchmarks/record_parser.py -e 300
+
+import os
+import sys
+import random
+import struct
+import argparse
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from Xlib import X
+from Xlib.protocol import rq
+from Xlib.protocol.display import Display
+
+
+def synthetic_reply(count):
+    # a mix of what the record context sees during play
+    types = [X.KeyPress, X.KeyRelease, X.ButtonPress, X.ButtonRelease, X.MotionNotify]
+    data = b""
+    for i in range(count):
+        event_type = random.choice(types)
+        data += struct.pack(
+            "=BBHLLLLhhhhHBx",
+            event_type,
+            random.randint(10, 100),
+            0,
+            i,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            1,
+        )
+    return data
+
+
+def xlib_parse(data, display):
+    keycodes = []
+    while len(data):
+        event, data = rq.EventField(None).parse_binary_value(data, display, None, None)
+        if event.type == X.KeyPress:
+            keycodes.append(event.detail)
+    return keycodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record reply parser benchmark")
+    parser.add_argument(
+        "-e", "--events", help="events per reply", type=int, default=300
+    )
+    parser.add_argument(
+        "-n", "--number", help="replies to parse", type=int, default=200
+    )
+    args = parser.parse_args()
+
+    from xvfb import xvfb
+
+    with xvfb():
+        from brawler.input import key_presses
+
+        display = Display()
+        data = synthetic_reply(args.events)
+        assert xlib_parse(data, display) == key_presses(data)
+
+        for name, func in (
+            ("xlib", lambda: xlib_parse(data, display)),
+            ("memoryview", lambda: key_presses(data)),
+        ):
+            seconds = timeit.timeit(func, number=args.number)
+            print(
+                "{:10} {:8.3f}ms per reply of {} events".format(
+                    name, seconds / args.number * 1000, args.events
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Replays an input trace against stand-in clients on a private Xvfb server and
+# compares the injection latency with the recorded session.
+#
+#   python benchmarks/replay.py session.trace
+#   python benchmarks/replay.py session.trace -s 4 -c config.yml -o replayed.trace
+#
+# Without a config every key is sent to the toons it was recorded for, as it
+# was recorded. With one the recorded keycodes go through the keys_allowed and
+# toon profiles of that config instead, like live input would.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from brawler import trace
+
+
+def recorded(path):
+    # toons and keys of a trace
+    toons = 0
+    keys = set()
+    for record in trace.read(path):
+        if record[0] == trace.KEY_RECORD:
+            for client, key_string in record[4]:
+                toons = max(toons, client)
+                keys.add(key_string)
+    return toons, keys
+
+
+def run(path, output, speed, conf, backend):
+    from fleet import standins
+    from brawler.api import brawler_config
+    from brawler.input import duplicator
+
+    toons, keys = recorded(path)
+    targets = conf is None
+    conf = dict(conf or {})
+    conf.update(
+        {
+            "accounts": {"master": None, "toons": []},
+            "executable": "wow.exe",
+            "wine_bin": "wine",
+            "wine_prefix_base": tempfile.gettempdir(),
+            "keys_allowed": conf.get("keys_allowed", sorted(keys)),
+            "input_backend": backend,
+            "launch_settle": 0,
+            "launch_concurrency": toons + 1,
+            "telemetry_interval": 0,
+        }
+    )
+    for name in ("trace_file", "displays", "resources", "metrics_file"):
+        conf.pop(name, None)
+    config = brawler_config(conf, SimpleNamespace(toons=toons, dual_monitor=False))
+    standin_client, standin_controller = standins()
+    ctrl = standin_controller(config)
+
+    try:
+        ctrl.launch_clients()
+        for c in ctrl.clients:
+            c.wait_for_window()
+        dup = duplicator(
+            ctrl.clients, config.keys_allowed, 1024, "block", routes=config.routing
+        )
+        writer = trace.trace_writer(output)
+        dup.set_trace(writer)
+        start = time.perf_counter()
+        count = trace.replay(dup, path, speed, targets)
+        while any(dup.fanout.depths().values()):
+            time.sleep(0.05)
+        print("replayed {} keys in {:.2f}s".format(count, time.perf_counter() - start))
+        dup.fanout.stop()
+        writer.close()
+    finally:
+        for c in ctrl.clients:
+            c.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="brawler input trace replay")
+    parser.add_argument("trace", help="recorded input trace")
+    parser.add_argument(
+        "-s", "--speed", help="speed factor, 0 for no pauses", type=float, default=1.0
+    )
+    parser.add_argument("-c", "--config", help="brawler config for keys and profiles")
+    parser.add_argument("-o", "--output", help="trace of the replay")
+    parser.add_argument("--backend", help="input backend", default="xlib")
+    args = parser.parse_args()
+
+    conf = None
+    if args.config:
+        with open(args.config, "r") as stream:
+            conf = yaml.safe_load(stream)
+    output = args.output or os.path.join(tempfile.gettempdir(), "brawler-replay.trace")
+
+    from xvfb import xvfb
+
+    with xvfb():
+        run(args.trace, output, args.speed, conf, args.backend)
+
+    trace.print_summary(args.trace)
+    trace.print_summary(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Stand-in for a Wine client: a top level window named like the wine virtual
+# desktop with a "Default IME" child. Every key press on the child is printed
+# as "<keycode> <perf_counter>" so the benchmark can measure fan-out latency.
+#
+#   python benchmarks/standin.py client_1 wow.exe 640 480
+
+import os
+import sys
+import time
+
+from Xlib import X
+from Xlib.display import Display
+
+
+def main():
+    name, executable = sys.argv[1], sys.argv[2].lower()
+    width, height = int(sys.argv[3]), int(sys.argv[4])
+
+    disp = Display()
+    screen = disp.screen()
+    desktop = screen.root.create_window(
+        0, 0, width, height, 0, screen.root_depth, event_mask=X.StructureNotifyMask
+    )
+    desktop.set_wm_name("{} - Wine desktop".format(name))
+    desktop.set_wm_class("explorer.exe", "explorer.exe")
+    desktop.change_property(
+        disp.get_atom("_NET_WM_PID"), disp.get_atom("CARDINAL"), 32, [os.getpid()]
+    )
+    desktop.map()
+
+    ime = desktop.create_window(
+        0, 0, 1, 1, 0, screen.root_depth, event_mask=X.KeyPressMask
+    )
+    ime.set_wm_name("Default IME")
+    ime.set_wm_class(executable, executable)
+    ime.change_property(
+        disp.get_atom("_NET_WM_PID"), disp.get_atom("CARDINAL"), 32, [os.getpid()]
+    )
+    disp.sync()
+
+    while True:
+        event = disp.next_event()
+        if event.type == X.KeyPress:
+            print("{} {}".format(event.detail, time.perf_counter()), flush=True)
+        elif event.type == X.DestroyNotify:
+            return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+import subprocess
+
+
+class xvfb:
+    # starts a private Xvfb server and points DISPLAY at it, unless export is off
+
+    def __init__(self, width=1920, height=1080, export=True):
+        self.width = width
+        self.height = height
+        self.export = export
+        self.proc = None
+        self.display = None
+        self.previous = None
+
+    def free_display(self):
+        for n in range(90, 200):
+            if not os.path.exists("/tmp/.X11-unix/X{}".format(n)) and not (
+                os.path.exists("/tmp/.X{}-lock".format(n))
+            ):
+                return n
+        raise RuntimeError("no free display number found")
+
+    def start(self, timeout=10):
+        n = self.free_display()
+        self.display = ":{}".format(n)
+        self.proc = subprocess.Popen(
+            [
+                "Xvfb",
+                self.display,
+                "-screen",
+                "0",
+                "{}x{}x24".format(self.width, self.height),
+                "-nolisten",
+                "tcp",
+                "+extension",
+                "RECORD",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while not os.path.exists("/tmp/.X11-unix/X{}".format(n)):
+            if self.proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Xvfb {} did not start".format(self.display))
+            time.sleep(0.05)
+        if self.export:
+            self.previous = os.environ.get("DISPLAY")
+            os.environ["DISPLAY"] = self.display
+        return self.display
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+        if self.previous is not None:
+            os.environ["DISPLAY"] = self.previous
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
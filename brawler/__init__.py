@@ -20,12 +20,27 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from brawler.api import brawler_client, brawler_config, brawler_controller
-from brawler.cli import main
 from brawler import config
 
 __VERSION__ = config.VERSION
 __AUTHOR__ = config.AUTHOR
 
+
+def __getattr__(name):
+    # brawler.api pulls in Xlib and probes the X server, only import it when
+    # it is actually used, so e.g. brawler --help works without a display
+    if name in ("brawler_client", "brawler_config", "brawler_controller"):
+        from brawler import api
+
+        return getattr(api, name)
+    if name == "main":
+        from brawler.cli import main
+
+        return main
+    raise AttributeError("module 'brawler' has no attribute '{}'".format(name))
+
+
 if __name__ == "__main__":
+    from brawler.cli import main
+
     main()
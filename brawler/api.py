@@ -21,80 +21,155 @@
 import os
 import time
 import signal
+import subprocess
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from brawler.process import (
     execute,
-    shell,
+    spawn,
+    signal_group,
+    group_alive,
+    group_pids,
 )
 from brawler.window import (
     windowmove,
     windowsize,
     get_window,
     get_child_window,
-    send_key,
     undecorate,
     get_window_pid,
+    flush,
+    wait_for,
+    wait_until_drawn,
+    get_window_name,
+    matches,
+    resource,
+    on_screen_change,
 )
-from brawler.screen import calculate_offset, get_primary_resolution
+from brawler import screen
+from brawler import layout
 from brawler.input import duplicator
-from brawler import config as global_config
-from brawler.logging import log
+from brawler.inject import get_injector
+from brawler.shard import remote_injector
+from brawler.stats import metrics_writer
+from brawler.telemetry import sampler
+from brawler import trace
+from brawler.prefix import check_template, ensure_prefix
+from brawler.routing import routing
+from brawler.resources import resources
+from brawler import session
+from brawler.logging import log, key_log, set_level, set_key_rate
 
-
-def wait_for(func, step=5, timeout=30):
-    i = 0
-    while i < timeout:
-        result = func()
-        if result is not None:
-            break
-        else:
-            time.sleep(step)
-            i += step
-    return result
+# spare clients are parked outside of the visible screen area
+OFFSCREEN = -10000
 
 
 class brawler_config:
     def __init__(self, config, args):
         # Set global config
-        if loglevel in config:
-            global_config.LOGLEVEL = config["loglevel"]
+        if "loglevel" in config:
+            set_level(config["loglevel"])
+        set_key_rate(config.get("log_key_rate", 20))
 
         # read config options
-        self.screen_resolution_x, self.screen_resolution_y = get_primary_resolution()
-        self.screen_resolution_offset = calculate_offset()
         self.executable = config["executable"]
         self.accounts = config["accounts"]
         self.wine_bin = config["wine_bin"]
         self.wine_prefix_base = config["wine_prefix_base"]
         self.keys_allowed = config["keys_allowed"]
+        self.input_backend = config.get("input_backend", "xlib")
+        self.send_queue_size = config.get("send_queue_size", 64)
+        self.send_queue_policy = config.get("send_queue_policy", "drop_oldest")
+        self.launch_concurrency = config.get("launch_concurrency", 4)
+        self.launch_settle = config.get("launch_settle", 2)
+        self.metrics_file = config.get("metrics_file")
+        self.metrics_interval = config.get("metrics_interval", 5)
+        self.telemetry_interval = config.get("telemetry_interval", 5)
+        self.telemetry_history = config.get("telemetry_history", 720)
+        self.telemetry_pss = config.get("telemetry_pss", False)
+        self.trace_file = config.get("trace_file")
+        if self.trace_file:
+            self.trace_file = os.path.expanduser(self.trace_file)
+        self.wine_prefix_template = config.get("wine_prefix_template")
+        self.wine_prefix_clone = config.get("wine_prefix_clone", "reflink")
+        self.wine_prefix_private = config.get("wine_prefix_private", [])
+        if self.wine_prefix_template:
+            check_template(self.wine_prefix_template, self.wine_prefix_base)
+        self.wineserver_bin = config.get(
+            "wineserver_bin",
+            os.path.join(os.path.dirname(self.wine_bin), "wineserver"),
+        )
+        self.wineserver_prewarm = config.get("wineserver_prewarm", False)
+        self.spare_clients = config.get("spare_clients", 0)
+        self.shutdown_timeout = config.get("shutdown_timeout", 3)
+        self.wineserver_kill = config.get("wineserver_kill", False)
+        self.capture_mode = config.get("capture_mode", "record")
+        self.session_file = os.path.expanduser(
+            config.get("session_file", "~/.cache/brawler/session.json")
+        )
+        self.routing = routing.from_config(config)
+        # X display -> client ids running on it, all others use the default display
+        self.displays = config.get("displays") or {}
+        self.resources = resources.from_config(config)
 
         # set args
-        self.toon_count = args.toons
+        # --attach takes the toon count from the session file
+        self.toon_count = args.toons or 0
         self.dual_monitor = args.dual_monitor
+        self.reset_prefixes = getattr(args, "reset_prefixes", False)
 
-        # calculate master and toon resolutions
-        # TODO configureable split
-        self.master_resolution_y = self.screen_resolution_y - 28
-        self.master_resolution_x = (
-            self.master_resolution_y / 3 * 4
-            if not args.dual_monitor
-            else self.screen_resolution_x
+        # in dual monitor mode the master fills its monitor by default
+        self.layout = config.get(
+            "layout", "columns" if self.dual_monitor else "master_stack"
         )
-        self.toon_resolution_y = (
-            self.screen_resolution_y / self.toon_count
-            if not args.dual_monitor
-            else (self.screen_resolution_y / (self.toon_count / 2))
+        self.master_aspect = config.get(
+            "master_aspect", None if self.dual_monitor else layout.ASPECT
         )
-        self.toon_resolution_x = (
-            self.screen_resolution_x - self.master_resolution_x
-            if not args.dual_monitor
-            else self.screen_resolution_x / (self.toon_count / 2)
+        self.layout_columns = config.get("layout_columns", 2)
+        self.panel_height = config.get("panel_height", 28)
+        self.min_toon_width = config.get("min_toon_width", layout.MIN_TOON_WIDTH)
+        self.layout_settle = config.get("layout_settle", 1)
+
+        self.calculate_resolutions()
+
+    def display_for(self, id):
+        for display, ids in self.displays.items():
+            if id in ids:
+                return display
+        return None
+
+    def calculate_resolutions(self):
+        # tiles for the master and every toon on the current monitors, the
+        # layout engine caches them per monitor configuration
+        self.monitors = layout.topology(screen.get_monitors())
+        self.tiles = layout.compute(
+            self.monitors,
+            self.toon_count,
+            self.layout,
+            self.master_aspect,
+            self.panel_height,
+            self.layout_columns,
+            self.min_toon_width,
         )
+        id, self.master_resolution_x, self.master_resolution_y, x, y = self.tiles[0]
+        # spares are booted with the size of a toon
+        id, self.toon_resolution_x, self.toon_resolution_y, x, y = self.tiles[
+            min(1, len(self.tiles) - 1)
+        ]
 
 
 class brawler_client:
     def __init__(
-        self, id, resolution_x, resolution_y, wine_bin, wineprefix_base, executable
+        self,
+        id,
+        resolution_x,
+        resolution_y,
+        wine_bin,
+        wineprefix_base,
+        executable,
+        injector=None,
+        display=None,
+        resources=None,
     ):
         self.id = id
         self.name = "client_{}".format(self.id)
@@ -103,12 +178,28 @@ class brawler_client:
         self.wine_bin = wine_bin
         self.wineprefix_base = wineprefix_base
         self.executable = executable
+        self.display = display
+        self.resources = resources
+        self.role = "master" if id == 0 else "toons"
+        self.injector = (
+            injector if injector is not None else get_injector("xdotool", display)
+        )
         # Copy the current environment and modify it, so all other vars are honored
         self.environment = os.environ.copy()
         self.environment["WINEPREFIX"] = os.path.join(self.wineprefix_base, self.name)
+        if self.display is not None:
+            self.environment["DISPLAY"] = self.display
         self.virtual_desktop = None
         self.window = None
-        self.ime = '"Default IME": ("{}" "{}")'.format(
+        self.proc = None
+        self.pgid = None
+        self.pid = None
+        self.position_x = None
+        self.position_y = None
+        self.started = time.monotonic()
+        self.boot_time = None
+        self.ime = "Default IME"
+        self.ime_class = (
             os.path.basename(self.executable).lower(),
             os.path.basename(self.executable).lower(),
         )
@@ -117,40 +208,63 @@ class brawler_client:
         # Open executable with default Wine
         # TODO: configureable wine executable
         log.info("{}: initializing".format(self.name))
-        self.proc = shell(
-            "{} explorer /desktop={},{}x{} {} &>/dev/null &".format(
-                self.wine_bin,
-                self.name,
-                int(self.resolution_x),
-                int(self.resolution_y),
-                self.executable,
+        self.started = time.monotonic()
+        args = [
+            self.wine_bin,
+            "explorer",
+            "/desktop={},{}x{}".format(
+                self.name, int(self.resolution_x), int(self.resolution_y)
             ),
-            env=self.environment,
-        )
+            self.executable,
+        ]
+        if self.resources is not None:
+            args = self.resources.launch(self.role, args)
+        self.proc = spawn(args, env=self.environment)
+        if self.proc is None:
+            raise RuntimeError("{}: failed to start wine".format(self.name))
+        # wine runs in its own process group, named after the process we started
+        self.pgid = self.proc.pid
 
     def windowsize(self):
         log.info(
             "{}: resize {}x{}".format(self.name, self.resolution_x, self.resolution_y)
         )
-        windowsize(self.virtual_desktop, self.resolution_x, self.resolution_y)
+        windowsize(
+            self.virtual_desktop, self.resolution_x, self.resolution_y, self.display
+        )
 
-    def wait_for_virtual_desktop(self):
-        return wait_for(self.get_virtual_desktop)
+    def wait_for_virtual_desktop(self, timeout=30):
+        result = wait_for(self.get_virtual_desktop, timeout, self.display)
+        self.log_ready("virtual desktop", result)
+        return result
 
-    def wait_for_window(self):
-        return wait_for(self.get_window)
+    def wait_for_window(self, timeout=30):
+        result = wait_for(self.get_window, timeout, self.display)
+        self.log_ready("window", result)
+        return result
+
+    def log_ready(self, what, result):
+        elapsed = time.monotonic() - self.started
+        if result is None:
+            log.error("{}: {} not found after {:.2f}s".format(self.name, what, elapsed))
+        else:
+            log.info("{}: {} ready after {:.2f}s".format(self.name, what, elapsed))
 
     def windowmove(self, x, y):
         log.info("{}: move window to {},{}".format(self.name, x, y))
-        windowmove(self.virtual_desktop, x, y)
+        self.position_x = x
+        self.position_y = y
+        windowmove(self.virtual_desktop, x, y, self.display)
 
     def get_virtual_desktop(self):
-        self.virtual_desktop = get_window(self.name)
+        self.virtual_desktop = get_window(self.name, self.display)
         return self.virtual_desktop
 
     def get_window(self):
         if self.virtual_desktop is not None:
-            ime = get_child_window(self.virtual_desktop, self.ime)
+            ime = get_child_window(
+                self.virtual_desktop, self.ime, self.ime_class, self.display
+            )
             if ime is not None:
                 self.window = ime
         return self.window
@@ -158,137 +272,679 @@ class brawler_client:
     def login(self, user, password):
         log.info("{}: login".format(self.name))
         # wait for the window to be found so we can start the login
-        # TODO: this method is still buggy and still needs to be improved
-        self.wait_for_window()
-        self.get_window()
-        # wait a few seconds longer so we definetly have a window
-        time.sleep(2)
-        # Send Username and password via key inputs and login
-        for u in user:
-            send_key(self.window, u)
-        send_key(self.window, "Tab")
-        for p in password:
-            send_key(self.window, p)
-        send_key(self.window, "Enter")
+        if self.wait_for_window() is None:
+            raise RuntimeError("{}: window not found".format(self.name))
+        # and for the game to actually draw the login screen
+        if wait_until_drawn(self.virtual_desktop, display=self.display) is None:
+            log.warning("{}: login screen not drawn, trying anyway".format(self.name))
+        # Send Username and password, one batch per field
+        self.injector.send_keys(self.window, list(user) + ["Tab"])
+        self.injector.send_keys(self.window, list(password) + ["Enter"])
 
     def send_key(self, key):
-        log.info("{}: sending string {}".format(self.name, key))
-        send_key(self.window, key)
+        key_log.info("%s: sending string %s", self.name, key)
+        self.injector.send_key(self.window, key)
 
     def undecorate(self):
         if not self.virtual_desktop:
             self.get_virtual_desktop()
-        undecorate(self.virtual_desktop)
+        undecorate(self.virtual_desktop, self.display)
 
     def get_pid(self):
-        pid = get_window_pid(self.window)
-        return pid
+        if self.pid is None:
+            self.pid = get_window_pid(self.window, self.display)
+        return self.pid
+
+    def restore(self, state):
+        # take over an already running client from a saved session
+        self.virtual_desktop = state["virtual_desktop"]
+        self.window = state["window"]
+        self.pid = state["pid"]
+        self.pgid = state.get("pgid")
+        self.position_x = state["position_x"]
+        self.position_y = state["position_y"]
+
+    def exists(self):
+        return self.virtual_desktop is not None and matches(
+            get_window_name(resource(self.virtual_desktop, self.display)), self.name
+        )
 
-    def destroy(self):
-        pid = self.get_pid()
-        log.debug("{}: killing pid {}".format(self.name, pid))
-        os.kill(pid, signal.SIGTERM)
+    def get_pgid(self):
+        if self.pgid is None:
+            # attached to a client we didn't start, go by its window
+            try:
+                self.pgid = os.getpgid(self.get_pid())
+            except (OSError, TypeError):
+                return None
+        return self.pgid
+
+    def apply_resources(self, role=None):
+        # (re)apply the cpu, priority and cgroup policy to the running client
+        if role is not None:
+            self.role = role
+        pgid = self.get_pgid()
+        if self.resources is not None and pgid is not None:
+            self.resources.apply(self.role, group_pids(pgid))
+
+    def terminate(self, sig=signal.SIGTERM):
+        pgid = self.get_pgid()
+        if pgid is not None:
+            log.debug("{}: sending {} to group {}".format(self.name, sig.name, pgid))
+            signal_group(pgid, sig)
+
+    def is_alive(self):
+        # reap our own child first, a zombie would still count as alive
+        if self.proc is not None:
+            self.proc.poll()
+        pgid = self.get_pgid()
+        return pgid is not None and group_alive(pgid)
+
+    def destroy(self, timeout=5):
+        self.terminate()
+        deadline = time.monotonic() + timeout
+        while self.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.is_alive():
+            self.terminate(signal.SIGKILL)
 
 
 class brawler_controller:
+    # clients are created from this class, so it can be swapped for stand-ins
+    client_class = brawler_client
+
     def __init__(self, config):
         self.config = config
         self.clients = []
         self.duplicator = None
         self.is_listening = False
-
-    def launch_client(self, id, res_x, res_y, wine_bin, winepfx_base, exe):
-        client = brawler_client(id, res_x, res_y, wine_bin, winepfx_base, exe)
-        client.open()
-        client.wait_for_virtual_desktop()
-        # TODO: check child procs and try to kill them
-        client.undecorate()
-        time.sleep(2)
-        client.windowsize()
-        self.clients.append(client)
-        return client
-
-    def launch_clients(self):
-        # configure and launch master instance
-        master = self.launch_client(
-            0,
-            self.config.master_resolution_x,
-            self.config.master_resolution_y,
+        self.listener = None
+        # display -> injector, opened on first launch so a dry run doesn't need
+        # a display, other displays than the default get a worker process
+        self.injectors = {}
+        self.metrics = None
+        self.telemetry = None
+        self.trace = None
+        self.watching_screen = False
+        self.relayout_timer = None
+        # booted clients waiting off-screen to replace or add a toon
+        self.spares = []
+        self.booting_spares = 0
+        self.next_id = 0
+        self.prepared = set()
+        self.lock = threading.Lock()
+
+    def prepare_prefix(self, id):
+        # materialize the prefix once, even if we prewarm and launch it
+        prefix = os.path.join(self.config.wine_prefix_base, "client_{}".format(id))
+        with self.lock:
+            if id in self.prepared:
+                return prefix
+            self.prepared.add(id)
+        if self.config.wine_prefix_template:
+            ensure_prefix(
+                self.config.wine_prefix_template,
+                prefix,
+                self.config.wine_prefix_clone,
+                self.config.wine_prefix_private,
+                self.config.reset_prefixes,
+            )
+        return prefix
+
+    def prewarm(self, ids):
+        # start a persistent wineserver per prefix, so clients skip that on boot
+        for id in ids:
+            env = os.environ.copy()
+            env["WINEPREFIX"] = self.prepare_prefix(id)
+            log.debug("client_{}: starting wineserver".format(id))
+            args = self.config.resources.launch(
+                "master" if id == 0 else "toons", [self.config.wineserver_bin, "-p"]
+            )
+            spawn(args, env=env)
+
+    def open_injector(self, display=None):
+        with self.lock:
+            if display not in self.injectors:
+                if display is None:
+                    injector = get_injector(self.config.input_backend)
+                else:
+                    log.info("starting injection worker for {}".format(display))
+                    injector = remote_injector(display, self.config.input_backend)
+                self.injectors[display] = injector
+        return self.injectors[display]
+
+    def launch_client(self, id, res_x, res_y, pos_x, pos_y):
+        start = time.monotonic()
+        client = self.client_class(
+            id,
+            res_x,
+            res_y,
             self.config.wine_bin,
             self.config.wine_prefix_base,
             self.config.executable,
+            self.open_injector(self.config.display_for(id)),
+            self.config.display_for(id),
+            self.config.resources,
         )
-        master.windowmove(self.config.screen_resolution_offset, 0)
+        self.prepare_prefix(id)
+        client.open()
+        try:
+            if client.wait_for_virtual_desktop() is None:
+                raise RuntimeError("{}: virtual desktop not found".format(client.name))
+            client.undecorate()
+            flush()
+            time.sleep(self.config.launch_settle)
+            # apply the layout as soon as this client is ready
+            client.windowsize()
+            client.windowmove(pos_x, pos_y)
+            flush()
+        except Exception:
+            # nobody else knows about this wine process group, don't orphan it
+            try:
+                client.destroy()
+            except Exception as e:
+                log.error("{}: failed to destroy: {}".format(client.name, e))
+            raise
+        client.boot_time = time.monotonic() - start
+        return client
 
-        # configure and launch toons
-        x_pos = (
-            self.config.screen_resolution_offset + self.config.master_resolution_x
-            if not self.config.dual_monitor
-            else 0
-        )
-        y_pos = 0
-        for s in range(0, self.config.toon_count):
-            toon = self.launch_client(
-                s + 1,
+    def launch_spare(self):
+        with self.lock:
+            id = self.next_id
+            self.next_id += 1
+        try:
+            spare = self.launch_client(
+                id,
                 self.config.toon_resolution_x,
                 self.config.toon_resolution_y,
+                OFFSCREEN,
+                OFFSCREEN,
+            )
+            spare.wait_for_window()
+        except Exception as e:
+            log.error("client_{}: spare launch failed: {}".format(id, e))
+            with self.lock:
+                self.booting_spares -= 1
+            return None
+
+        log.info("{}: spare ready after {:.2f}s".format(spare.name, spare.boot_time))
+        with self.lock:
+            self.booting_spares -= 1
+            self.spares.append(spare)
+        self.save_session()
+        return spare
+
+    def replenish_spares(self):
+        # boot spares in the background until the pool is full again, spares
+        # that are still booting count as well
+        with self.lock:
+            missing = self.config.spare_clients - len(self.spares) - self.booting_spares
+            self.booting_spares += max(missing, 0)
+        for i in range(missing):
+            threading.Thread(target=self.launch_spare, daemon=True).start()
+
+    def take_spare(self, res_x, res_y, pos_x, pos_y):
+        with self.lock:
+            if len(self.spares) == 0:
+                return None
+            spare = self.spares.pop(0)
+
+        start = time.monotonic()
+        spare.resolution_x = res_x
+        spare.resolution_y = res_y
+        spare.windowsize()
+        spare.windowmove(pos_x, pos_y)
+        flush()
+        log.info(
+            "{}: swapped in after {:.3f}s, a cold start took {:.2f}s".format(
+                spare.name, time.monotonic() - start, spare.boot_time
+            )
+        )
+        self.replenish_spares()
+        return spare
+
+    def start_client(self, res_x, res_y, pos_x, pos_y):
+        # use a warm spare if we have one, cold boot a new client otherwise
+        client = self.take_spare(res_x, res_y, pos_x, pos_y)
+        if client is None:
+            with self.lock:
+                id = self.next_id
+                self.next_id += 1
+            client = self.launch_client(id, res_x, res_y, pos_x, pos_y)
+            # keys can only be sent once the game window is there
+            if client.wait_for_window() is None:
+                log.warning("{}: started without a game window".format(client.name))
+        return client
+
+    def apply_layout(self):
+        for client, l in zip(self.clients, self.layout()):
+            id, res_x, res_y, x, y = l
+            client.resolution_x = res_x
+            client.resolution_y = res_y
+            client.windowsize()
+            client.windowmove(x, y)
+        flush()
+
+    def add_toon(self):
+        self.config.toon_count += 1
+        self.config.calculate_resolutions()
+        id, res_x, res_y, x, y = self.layout()[len(self.clients)]
+        try:
+            client = self.start_client(res_x, res_y, x, y)
+        except Exception:
+            # keep the layout in line with the clients we actually have
+            self.config.toon_count -= 1
+            self.config.calculate_resolutions()
+            raise
+        self.clients.append(client)
+        if self.duplicator is not None:
+            self.duplicator.add_client(client)
+        self.apply_layout()
+        self.save_session()
+        return client
+
+    def replace_client(self, slot):
+        # replace the client at the given position, e.g. after it crashed
+        old = self.clients[slot]
+        id, res_x, res_y, x, y = self.layout()[slot]
+        if self.duplicator is not None:
+            self.duplicator.remove_client(old)
+        try:
+            old.destroy()
+        except Exception as e:
+            log.error("{}: failed to destroy: {}".format(old.name, e))
+        client = self.start_client(res_x, res_y, x, y)
+        self.clients[slot] = client
+        self.config.routing.replace(old, client)
+        if slot == 0:
+            # spares boot as toons
+            client.apply_resources("master")
+            if self.duplicator is not None:
+                self.duplicator.master_changed()
+        # the master (slot 0) doesn't get keys duplicated
+        if self.duplicator is not None and slot > 0:
+            self.duplicator.add_client(client)
+        self.save_session()
+        return client
+
+    def remove_toon(self, slot=None):
+        # remove a toon, the last one by default, and close the gap in the layout
+        slot = len(self.clients) - 1 if slot is None else slot
+        if slot < 1 or slot >= len(self.clients):
+            raise ValueError("no toon at position {}".format(slot))
+        client = self.clients.pop(slot)
+        if self.duplicator is not None:
+            self.duplicator.remove_client(client)
+        try:
+            client.destroy()
+        except Exception as e:
+            log.error("{}: failed to destroy: {}".format(client.name, e))
+        self.config.toon_count -= 1
+        if self.config.toon_count > 0:
+            self.config.calculate_resolutions()
+            self.apply_layout()
+        self.save_session()
+        return client
+
+    def pause(self):
+        log.info("pausing key broadcasting")
+        if self.duplicator is not None:
+            self.duplicator.paused = True
+
+    def resume(self):
+        log.info("resuming key broadcasting")
+        if self.duplicator is not None:
+            self.duplicator.paused = False
+
+    def layout(self):
+        # returns id, resolution and position for the master and every toon
+        return list(self.config.tiles)
+
+    def watch_screen(self):
+        # re-layout when monitors are added, removed or change their mode
+        if not self.watching_screen:
+            self.watching_screen = True
+            on_screen_change(self.screen_changed)
+
+    def screen_changed(self):
+        # a monitor change comes as a burst of RandR events, so wait for them
+        # to settle and lay out once
+        with self.lock:
+            if self.relayout_timer is not None:
+                self.relayout_timer.cancel()
+            self.relayout_timer = threading.Timer(
+                self.config.layout_settle, self.relayout
+            )
+            self.relayout_timer.daemon = True
+            self.relayout_timer.start()
+
+    def relayout(self):
+        screen.reset()
+        self.config.calculate_resolutions()
+        log.info(
+            "monitors: {}, applying layout".format(
+                " ".join(
+                    "{}x{}+{}+{}".format(w, h, x, y)
+                    for x, y, w, h, p in self.config.monitors
+                )
+            )
+        )
+        self.apply_layout()
+        self.save_session()
+
+    def launch_clients(self):
+        # boot all clients in parallel, limited so we don't thrash disk and wineserver
+        start = time.monotonic()
+        layout = self.layout()
+        self.next_id = len(layout)
+        if self.config.wineserver_prewarm:
+            self.prewarm(range(len(layout) + self.config.spare_clients))
+
+        clients = {}
+        with ThreadPoolExecutor(max_workers=self.config.launch_concurrency) as pool:
+            futures = {pool.submit(self.launch_client, *l): l[0] for l in layout}
+            for future in as_completed(futures):
+                id = futures[future]
+                try:
+                    clients[id] = future.result()
+                except Exception as e:
+                    log.error("client_{}: launch failed: {}".format(id, e))
+
+        self.clients = [clients[id] for id in sorted(clients)]
+        if 0 not in clients:
+            # a toon would take the master slot, the toons get cleaned up by destroy
+            raise RuntimeError("client_0: master failed to launch, giving up")
+        log.info(
+            "launched {} clients in {:.2f}s".format(
+                len(self.clients), time.monotonic() - start
+            )
+        )
+        for c in self.clients:
+            c.get_window()
+            c.get_pid()
+        self.save_session()
+        self.replenish_spares()
+        self.watch_screen()
+
+    def save_session(self):
+        try:
+            session.save(self.config.session_file, self.clients, list(self.spares))
+        except Exception as e:
+            log.error("failed to save session: {}".format(e))
+
+    def attach(self):
+        # rebuild the clients from the session file instead of launching them,
+        # clients whose windows are gone get launched again
+        start = time.monotonic()
+        state = session.load(self.config.session_file)
+        # the session knows how many toons there are, -t may be missing or stale
+        self.config.toon_count = max(len(state["clients"]) - 1, 0)
+        self.config.calculate_resolutions()
+        layout = self.layout()
+        self.next_id = max(
+            [c["id"] + 1 for c in state["clients"] + state["spares"]] + [len(layout)]
+        )
+
+        clients = []
+        for slot, c in enumerate(state["clients"]):
+            client = self.client_class(
+                c["id"],
+                c["resolution_x"],
+                c["resolution_y"],
+                self.config.wine_bin,
+                self.config.wine_prefix_base,
+                self.config.executable,
+                self.open_injector(c.get("display")),
+                c.get("display"),
+                self.config.resources,
+            )
+            client.restore(c)
+            if not client.exists():
+                log.warning("{}: window is gone, relaunching".format(client.name))
+                id, res_x, res_y, x, y = layout[slot]
+                try:
+                    client = self.launch_client(c["id"], res_x, res_y, x, y)
+                except Exception as e:
+                    log.error("{}: relaunch failed: {}".format(client.name, e))
+                    continue
+                # keys can only be sent once the game window is there
+                if client.wait_for_window() is None:
+                    log.warning(
+                        "{}: relaunched without a game window".format(client.name)
+                    )
+            clients.append(client)
+        self.clients = clients
+        if len(clients) - 1 != self.config.toon_count:
+            # some clients couldn't be relaunched
+            self.config.toon_count = max(len(clients) - 1, 0)
+            self.config.calculate_resolutions()
+
+        for c in state["spares"]:
+            spare = self.client_class(
+                c["id"],
+                c["resolution_x"],
+                c["resolution_y"],
                 self.config.wine_bin,
                 self.config.wine_prefix_base,
                 self.config.executable,
+                self.open_injector(c.get("display")),
+                c.get("display"),
+                self.config.resources,
             )
-            toon.windowmove(x_pos, y_pos)
+            spare.restore(c)
+            if spare.exists():
+                self.spares.append(spare)
 
-            if self.config.dual_monitor:
-                y_pos += self.config.toon_resolution_y
-                if s + 1 == self.config.toon_count / 2:
-                    y_pos = 0
-                    x_pos += self.config.toon_resolution_x
-            else:
-                y_pos = (s + 1) * self.config.toon_resolution_y
+        log.info(
+            "attached to {} clients in {:.2f}s".format(
+                len(self.clients), time.monotonic() - start
+            )
+        )
+        self.apply_resources()
+        self.save_session()
+        self.replenish_spares()
+        self.watch_screen()
 
     def login(self):
-        if len(self.clients) > 0:
-            if self.config.accounts["master"]:
-                self.clients[0].login(
-                    self.config.accounts["master"]["user"],
-                    self.config.accounts["master"]["password"],
-                )
-                i = 0
-            if len(self.config.accounts["toons"]) > 0:
-                for c in self.clients[1:]:
-                    if self.config.accounts["toons"][i]:
-                        log.info("{}: account found".format(self.clients[i].name))
-                        c.login(
-                            self.config.accounts["toons"][i]["user"],
-                            self.config.accounts["toons"][i]["password"],
-                        )
-                        i += 1
-                    else:
-                        break
-            else:
-                log.error("no clients found")
+        if len(self.clients) == 0:
+            log.error("no clients found")
+            return
+
+        accounts = [self.config.accounts.get("master")] + list(
+            self.config.accounts.get("toons") or []
+        )
+        logins = [
+            (c, accounts[c.id])
+            for c in self.clients
+            if c.id < len(accounts) and accounts[c.id]
+        ]
+        if len(logins) == 0:
+            log.error("no accounts found")
+            return
+
+        # log in all clients at the same time
+        with ThreadPoolExecutor(max_workers=len(logins)) as pool:
+            futures = {
+                pool.submit(c.login, a["user"], a["password"]): c for c, a in logins
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error("{}: login failed: {}".format(futures[future].name, e))
 
     def __listen(self):
-        log.debug("start listening for key input")
-        while self.is_listening:
-            self.duplicator.listen()
+        self.duplicator.run()
+        self.is_listening = False
+
+    def create_duplicator(self):
+        if self.duplicator == None:
+            log.debug("initialize key duplicator")
+            if self.config.trace_file and self.trace is None:
+                self.trace = trace.trace_writer(self.config.trace_file)
+            self.duplicator = duplicator(
+                self.clients,
+                self.config.keys_allowed,
+                self.config.send_queue_size,
+                self.config.send_queue_policy,
+                self.config.capture_mode,
+                self.config.routing,
+                self.trace,
+            )
+        return self.duplicator
 
     def listen(self):
         # listen for key events and start a duplicator if needed
+        self.create_duplicator()
 
-        if self.duplicator == None:
-            log.debug("initialize key duplicator")
-            self.duplicator = duplicator(self.clients, self.config.keys_allowed)
+        if self.config.metrics_file and self.metrics is None:
+            self.metrics = metrics_writer(
+                self.config.metrics_file, self.stats, self.config.metrics_interval
+            )
+            self.metrics.start()
+
+        if self.config.telemetry_interval and self.telemetry is None:
+            self.telemetry = sampler(
+                lambda: self.clients + self.spares,
+                self.config.telemetry_interval,
+                self.config.telemetry_history,
+                self.config.telemetry_pss,
+            )
+            self.telemetry.start()
 
         self.is_listening = True
-        t = threading.Thread(target=self.__listen, args=[])
-        t.start()
+        self.listener = threading.Thread(target=self.__listen, args=[])
+        self.listener.start()
+        # the input and queue threads are running now, pin them too
+        self.config.resources.apply_self()
+
+    def start_trace(self, path):
+        # start writing a new input trace, e.g. right when toons start missing keys
+        writer = trace.trace_writer(os.path.expanduser(path))
+        old = self.trace
+        self.trace = writer
+        if self.duplicator is not None:
+            self.duplicator.set_trace(writer)
+        if old is not None:
+            old.close()
+        return writer.path
+
+    def stop_trace(self):
+        old = self.trace
+        self.trace = None
+        if self.duplicator is not None:
+            self.duplicator.set_trace(None)
+        if old is not None:
+            old.close()
+            return old.path
+
+    def replay(self, path, speed=1.0, timeout=30):
+        # send the keys of a trace to the clients instead of listening to the
+        # keyboard, then wait for the send queues to run empty
+        dup = self.create_duplicator()
+        start = time.monotonic()
+        count = trace.replay(dup, path, speed)
+        deadline = time.monotonic() + timeout
+        while any(dup.fanout.depths().values()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        log.info(
+            "replayed {} keys from {} in {:.2f}s".format(
+                count, path, time.monotonic() - start
+            )
+        )
+        return count
+
+    def reload_profiles(self, config):
+        # recompile the key routing without touching the clients
+        log.info("reloading toon profiles")
+        routes = routing.from_config(config)
+        routes.keep(self.config.routing)
+        self.config.routing = routes
+        if self.duplicator is not None:
+            self.duplicator.set_routing(self.config.routing)
+
+    def apply_resources(self):
+        for slot, c in enumerate(self.clients):
+            c.apply_resources("master" if slot == 0 else "toons")
+        for c in self.spares:
+            c.apply_resources("toons")
+
+    def set_resources(self, role, **changes):
+        # change the policy of one role at runtime and apply it right away
+        p = self.config.resources.set(role, **changes)
+        if role == "brawler":
+            self.config.resources.apply_self()
+        else:
+            self.apply_resources()
+        return p.describe()
+
+    def reload_resources(self, config):
+        log.info("reloading resource policies")
+        self.config.resources.reload(config)
+        self.apply_resources()
+        self.config.resources.apply_self()
+
+    def stats(self):
+        stats = {
+            "clients": [c.name for c in self.clients],
+            "spares": [c.name for c in self.spares],
+            "resources": self.config.resources.describe(),
+        }
+        if self.duplicator is not None:
+            stats["recorded"] = self.duplicator.recorded
+            stats["wakeups"] = self.duplicator.wakeups
+            stats["paused"] = self.duplicator.paused
+            stats["queues"] = self.duplicator.fanout.stats()
+        if self.telemetry is not None:
+            stats["telemetry"] = self.telemetry.latest()
+        return stats
 
     def destroy(self):
+        if self.relayout_timer is not None:
+            self.relayout_timer.cancel()
         if self.is_listening:
-            self.debug("shutting down duplicator")
+            log.debug("shutting down duplicator")
             self.is_listening = False
+            self.duplicator.stop()
+            self.listener.join(timeout=1)
+        if self.metrics is not None:
+            self.metrics.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        if self.duplicator is not None:
+            self.duplicator.fanout.stop()
+        self.stop_trace()
+        for injector in self.injectors.values():
+            if isinstance(injector, remote_injector):
+                injector.stop()
 
         log.debug("destroying clients")
-        for c in self.clients:
-            c.destroy()
+        clients = self.clients + self.spares
+        start = time.monotonic()
+        # signal every process group first and then wait for all of them at once
+        for c in clients:
+            c.terminate()
+        deadline = start + self.config.shutdown_timeout
+        while time.monotonic() < deadline and any(c.is_alive() for c in clients):
+            time.sleep(0.05)
+        for c in clients:
+            if c.is_alive():
+                log.warning("{}: still running, killing it".format(c.name))
+                c.terminate(signal.SIGKILL)
+
+        if self.config.wineserver_kill:
+            # wineserver -k for every prefix, also in parallel
+            procs = [
+                spawn([self.config.wineserver_bin, "-k"], env=c.environment)
+                for c in clients
+            ]
+            for p in procs:
+                if p is not None:
+                    try:
+                        p.wait(timeout=self.config.shutdown_timeout)
+                    except subprocess.TimeoutExpired:
+                        p.kill()
+        log.info(
+            "destroyed {} clients in {:.2f}s".format(
+                len(clients), time.monotonic() - start
+            )
+        )
@@ -23,10 +23,10 @@ import os
 import yaml
 import signal
 import argparse
-from brawler.api import brawler_config, brawler_controller
 from brawler.logging import log
 
 ctrl = None
+config_file = None
 
 
 def handler(sig, frame):
@@ -36,7 +36,53 @@ def handler(sig, frame):
     exit()
 
 
+def reload_handler(sig, frame):
+    # re-read the config file and apply the toon profiles and resource policies
+    if ctrl:
+        try:
+            with open(config_file, "r") as stream:
+                config = yaml.safe_load(stream)
+            ctrl.reload_profiles(config)
+            ctrl.reload_resources(config)
+        except Exception as e:
+            log.error("failed to reload config: {}".format(e))
+
+
+def print_layout(ctrl):
+    config = ctrl.config
+    for x, y, w, h, primary in config.monitors:
+        print(
+            "monitor: {}x{}+{}+{}{}".format(w, h, x, y, " (primary)" if primary else "")
+        )
+    print("layout: {}".format(config.layout))
+    for id, res_x, res_y, x, y in ctrl.layout():
+        display = config.display_for(id)
+        print(
+            "client_{}: {}x{}+{}+{}{}{}".format(
+                id,
+                int(res_x),
+                int(res_y),
+                int(x),
+                int(y),
+                " on {}".format(display) if display is not None else "",
+                " (master)" if id == 0 else "",
+            )
+        )
+
+
+def serve(ctrl, path):
+    from brawler.daemon import control_server, default_socket
+
+    path = os.path.expanduser(path or default_socket())
+    server = control_server(ctrl, path, config_file)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
 def main():
+    global ctrl, config_file
     parser = argparse.ArgumentParser(description="Simple multiboxer on Linux/X.org")
     parser.add_argument("-t", "--toons", help="amount of toons", type=int)
     parser.add_argument(
@@ -56,21 +102,82 @@ def main():
         default=False,
         action="store_true",
     )
+    parser.add_argument(
+        "-r",
+        "--reset-prefixes",
+        help="recreate the client prefixes from wine_prefix_template",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-a",
+        "--attach",
+        help="attach to the clients of the last session instead of launching",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-D",
+        "--daemon",
+        help="keep running and accept commands on the control socket",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-s", "--socket", help="control socket for --daemon", type=str, default=None
+    )
+    parser.add_argument(
+        "--replay",
+        help="send the keys of an input trace to the clients instead of listening",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--replay-speed",
+        help="replay speed factor, 0 replays as fast as possible",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="print the computed layout without launching any client",
+        default=False,
+        action="store_true",
+    )
     args = parser.parse_args()
 
+    # imported here, so --help doesn't have to load Xlib and probe monitors
+    from brawler.api import brawler_config, brawler_controller
+
+    config_file = args.config
     with open(args.config, "r") as stream:
         conf_file = yaml.safe_load(stream)
 
     signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGHUP, reload_handler)
     config = brawler_config(conf_file, args)
     ctrl = brawler_controller(config)
+    if args.dry_run:
+        print_layout(ctrl)
+        return
     try:
-        ctrl.launch_clients()
-        if args.login:
-            ctrl.login()
+        if args.attach:
+            ctrl.attach()
         else:
-            w_input = input("Waiting for login. Do you want to continue?")
+            ctrl.launch_clients()
+            if args.login:
+                ctrl.login()
+            elif not args.daemon:
+                w_input = input("Waiting for login. Do you want to continue?")
+        if args.replay:
+            # the clients keep running, continue with --attach
+            ctrl.replay(args.replay, args.replay_speed)
+            ctrl.stop_trace()
+            return
         ctrl.listen()
+        if args.daemon:
+            serve(ctrl, args.socket or conf_file.get("control_socket"))
     except Exception as e:
         log.error(e)
         ctrl.destroy()
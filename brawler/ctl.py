@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import json
+import argparse
+
+from brawler.daemon import default_socket, send
+
+COMMANDS = (
+    "add",
+    "remove",
+    "restart",
+    "pause",
+    "resume",
+    "layout",
+    "reload",
+    "stats",
+    "resources",
+    "telemetry",
+    "loglevel",
+    "trace",
+    "replay",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control a running brawler daemon")
+    parser.add_argument("command", help="command to send", choices=COMMANDS)
+    parser.add_argument(
+        "args", help="command arguments, e.g. a toon position", nargs="*"
+    )
+    parser.add_argument(
+        "-s", "--socket", help="control socket", type=str, default=default_socket()
+    )
+    args = parser.parse_args()
+
+    try:
+        response = send(args.socket, args.command, args.args)
+    except OSError as e:
+        print("can't connect to {}: {}".format(args.socket, e), file=sys.stderr)
+        sys.exit(1)
+
+    if not response.get("ok"):
+        print("error: {}".format(response.get("error")), file=sys.stderr)
+        sys.exit(1)
+    if response.get("result") is not None:
+        print(json.dumps(response["result"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import yaml
+import threading
+import socketserver
+
+from brawler import config as global_config
+from brawler.logging import log, set_level
+
+
+def default_socket():
+    runtime = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+    return os.path.join(runtime, "brawler-{}.sock".format(os.getuid()))
+
+
+class control_handler(socketserver.StreamRequestHandler):
+    # one json object per line in both directions:
+    #   {"command": "add"} -> {"ok": true, "result": ...}
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.run(request["command"], request.get("args", []))
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                log.error("control command failed: {}".format(e))
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class control_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, ctrl, path, config_file=None):
+        self.ctrl = ctrl
+        self.path = path
+        self.config_file = config_file
+        # fleet changes are applied one at a time
+        self.lock = threading.Lock()
+        self.commands = {
+            "add": self.add,
+            "remove": self.remove,
+            "restart": self.restart,
+            "pause": lambda: self.ctrl.pause(),
+            "resume": lambda: self.ctrl.resume(),
+            "layout": lambda: self.ctrl.relayout(),
+            "reload": self.reload,
+            "stats": lambda: self.ctrl.stats(),
+            "resources": self.resources,
+            "telemetry": self.telemetry,
+            "loglevel": self.loglevel,
+            "trace": self.trace,
+            "replay": self.replay,
+        }
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, control_handler)
+        os.chmod(path, 0o600)
+        log.info("listening for control commands on {}".format(path))
+
+    def run(self, command, args):
+        if command not in self.commands:
+            raise ValueError("unknown command {}".format(command))
+        log.info("control command: {}".format(" ".join(map(str, [command] + args))))
+        with self.lock:
+            return self.commands[command](*args)
+
+    def add(self):
+        return self.ctrl.add_toon().name
+
+    def remove(self, slot=None):
+        return self.ctrl.remove_toon(None if slot is None else int(slot)).name
+
+    def restart(self, slot):
+        return self.ctrl.replace_client(int(slot)).name
+
+    def reload(self):
+        with open(self.config_file, "r") as stream:
+            config = yaml.safe_load(stream)
+        self.ctrl.reload_profiles(config)
+        self.ctrl.reload_resources(config)
+
+    def resources(self, role=None, *settings):
+        # resources toons nice=10 cpus=4-7, without settings just show them
+        if role is None:
+            return self.ctrl.config.resources.describe()
+        changes = {}
+        for setting in settings:
+            name, _, value = setting.partition("=")
+            changes[name] = yaml.safe_load(value)
+        return self.ctrl.set_resources(role, **changes)
+
+    def telemetry(self, count=None):
+        # the last samples of the client process telemetry, oldest first
+        if self.ctrl.telemetry is None:
+            return []
+        return self.ctrl.telemetry.history(count)
+
+    def trace(self, path=None):
+        # trace PATH starts a new input trace, trace without a path stops it
+        if path is None:
+            return self.ctrl.stop_trace()
+        return self.ctrl.start_trace(path)
+
+    def replay(self, path, speed=1.0):
+        return self.ctrl.replay(path, float(speed))
+
+    def loglevel(self, level=None):
+        if level is None:
+            return global_config.LOGLEVEL
+        return set_level(level)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def send(path, command, args=()):
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(json.dumps({"command": command, "args": list(args)}).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            data = s.recv(65536)
+            if not data:
+                break
+            response += data
+    return json.loads(response)
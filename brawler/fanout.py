@@ -0,0 +1,167 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import threading
+from collections import deque
+
+from brawler.stats import latency
+from brawler.logging import log
+
+POLICIES = ("drop_oldest", "block", "coalesce")
+
+
+class send_queue:
+    # bounded key queue with a worker thread for a single client, keys are sent
+    # in the order they were queued
+
+    def __init__(self, client, size=64, policy="drop_oldest", trace=None):
+        if policy not in POLICIES:
+            log.error("unknown queue policy {}, using drop_oldest".format(policy))
+            policy = "drop_oldest"
+
+        self.client = client
+        self.size = size
+        self.policy = policy
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.sent = 0
+        self.dropped = 0
+        self.latency = latency()
+        self.wait = latency()
+        # optional trace_writer, gets every sent and dropped key
+        self.trace = trace
+        self.thread = threading.Thread(
+            target=self.run, name="send_{}".format(client.name), daemon=True
+        )
+        self.thread.start()
+
+    def put(self, key, recorded=None, seq=None):
+        now = time.perf_counter()
+        item = (key, recorded if recorded is not None else now, now, seq)
+        with self.cond:
+            if len(self.queue) >= self.size:
+                if self.policy == "block":
+                    while self.running and len(self.queue) >= self.size:
+                        self.cond.wait()
+                elif self.policy == "coalesce" and any(i[0] == key for i in self.queue):
+                    # the same key is still pending, sending it twice won't help
+                    self.dropped += 1
+                    self.traced_drop(seq)
+                    return
+                else:
+                    self.traced_drop(self.queue.popleft()[3])
+                    self.dropped += 1
+            self.queue.append(item)
+            self.cond.notify_all()
+
+    def traced_drop(self, seq):
+        if self.trace is not None and seq is not None:
+            self.trace.dropped(seq, self.client)
+
+    def depth(self):
+        return len(self.queue)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                key, recorded, queued, seq = self.queue.popleft()
+                self.cond.notify_all()
+
+            try:
+                start = time.perf_counter()
+                self.client.send_key(key)
+                done = time.perf_counter()
+                self.sent += 1
+                self.wait.record(start - queued)
+                self.latency.record(done - recorded)
+                if self.trace is not None and seq is not None:
+                    self.trace.sent(seq, self.client, start, done)
+            except Exception as e:
+                log.error(
+                    "{}: failed to send key {}: {}".format(self.client.name, key, e)
+                )
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.queue.clear()
+            self.cond.notify_all()
+
+
+class fanout:
+    # one send queue per toon, so a slow client only delays its own keys
+
+    def __init__(self, clients, size=64, policy="drop_oldest", trace=None):
+        self.size = size
+        self.policy = policy
+        self.trace = trace
+        self.queues = [send_queue(c, size, policy, trace) for c in clients]
+
+    def add(self, client):
+        # swap in a new list, so put() never sees a half updated one
+        self.queues = self.queues + [
+            send_queue(client, self.size, self.policy, self.trace)
+        ]
+
+    def remove(self, client):
+        removed = [q for q in self.queues if q.client is client]
+        self.queues = [q for q in self.queues if q.client is not client]
+        for q in removed:
+            q.stop()
+
+    def put(self, key, recorded=None, seq=None):
+        for q in self.queues:
+            q.put(key, recorded, seq)
+
+    def set_trace(self, trace):
+        self.trace = trace
+        for q in self.queues:
+            q.trace = trace
+
+    def queue(self, client):
+        for q in self.queues:
+            if q.client is client:
+                return q
+        return None
+
+    def depths(self):
+        return {q.client.name: q.depth() for q in self.queues}
+
+    def stats(self):
+        return {
+            q.client.name: {
+                "depth": q.depth(),
+                "sent": q.sent,
+                "dropped": q.dropped,
+                "latency": q.latency.summary(),
+                "wait": q.wait.summary(),
+            }
+            for q in self.queues
+        }
+
+    def stop(self):
+        for q in self.queues:
+            q.stop()
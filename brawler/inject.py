@@ -0,0 +1,160 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+
+from brawler.window import send_key, send_keys, window_id
+from brawler.logging import log, key_log
+
+# key names used in the config and by xdotool that have a different X keysym name
+KEYSYM_ALIASES = {
+    "Enter": "Return",
+    "Esc": "Escape",
+    "Backspace": "BackSpace",
+    "Del": "Delete",
+}
+
+
+class xdotool_injector:
+    name = "xdotool"
+
+    def __init__(self, display=None):
+        self.display = display
+
+    def send_key(self, window, key):
+        send_key(window, key, self.display)
+
+    def send_keys(self, window, keys):
+        send_keys(window, keys, self.display)
+
+    def refresh(self):
+        pass
+
+
+class xlib_injector:
+    name = "xlib"
+
+    def __init__(self, display=None):
+        from Xlib import X, XK
+        from Xlib.display import Display
+        from Xlib.protocol import event
+
+        self.X = X
+        self.XK = XK
+        self.event = event
+        self.disp = Display(display)
+        self.root = self.disp.screen().root
+        self.lock = threading.Lock()
+        self.keycodes = {}
+
+    def lookup(self, key):
+        # resolve a key name to a keycode and modifier state, cached per key
+        if key in self.keycodes:
+            return self.keycodes[key]
+
+        name = KEYSYM_ALIASES.get(key, key)
+        keysym = self.XK.string_to_keysym(name)
+        if keysym == self.XK.NoSymbol and len(name) == 1:
+            # Latin-1 characters map directly to their keysym
+            keysym = ord(name)
+
+        result = None
+        for keycode, index in self.disp.keysym_to_keycodes(keysym):
+            # index 0 is the plain keysym, index 1 the shifted one
+            if index in (0, 1):
+                state = self.X.ShiftMask if index == 1 else 0
+                result = (keycode, state)
+                break
+
+        if result is None:
+            log.error("xlib: no keycode found for key {}".format(key))
+        self.keycodes[key] = result
+        return result
+
+    def refresh(self):
+        # keyboard mapping changed, reload the keymap of the whole keycode
+        # range and forget all resolved keycodes
+        info = self.disp.display.info
+        notify = self.event.MappingNotify(
+            request=self.X.MappingKeyboard,
+            first_keycode=info.min_keycode,
+            count=info.max_keycode - info.min_keycode + 1,
+        )
+        with self.lock:
+            self.disp.refresh_keyboard_mapping(notify)
+            self.keycodes = {}
+
+    def send_key(self, window, key):
+        key_log.debug("xlib: send key %s to window: %s", key, window)
+        self.send_keys(window, [key])
+
+    def send_keys(self, window, keys):
+        # queue press and release of every key and send them with one flush
+        with self.lock:
+            win = self.disp.create_resource_object("window", window_id(window))
+            for key in keys:
+                self.queue_key(win, key)
+            self.disp.flush()
+
+    def queue_key(self, win, key):
+        code = self.lookup(key)
+        if code is None:
+            return
+        keycode, state = code
+        for event_type, mask in (
+            (self.event.KeyPress, self.X.KeyPressMask),
+            (self.event.KeyRelease, self.X.KeyReleaseMask),
+        ):
+            ev = event_type(
+                time=self.X.CurrentTime,
+                root=self.root,
+                window=win,
+                same_screen=1,
+                child=self.X.NONE,
+                root_x=0,
+                root_y=0,
+                event_x=0,
+                event_y=0,
+                state=state,
+                detail=keycode,
+            )
+            win.send_event(ev, event_mask=mask, propagate=True)
+
+
+injectors = {
+    "xlib": xlib_injector,
+    "xdotool": xdotool_injector,
+}
+
+
+def get_injector(name="xlib", display=None):
+    if name not in injectors:
+        log.error("unknown input backend {}, using xdotool".format(name))
+        name = "xdotool"
+
+    try:
+        injector = injectors[name](display)
+    except Exception as e:
+        # python-xlib missing or no display available
+        log.error("input backend {} not available: {}".format(name, e))
+        injector = xdotool_injector(display)
+
+    log.debug("using input backend {}".format(injector.name))
+    return injector
@@ -18,21 +18,97 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import time
+import select
+import struct
+
 from Xlib import X
 from Xlib.XK import keysym_to_string
 from Xlib.ext import record
 from Xlib.display import Display
-from Xlib.protocol import rq
 
-from brawler.logging import log
+from brawler.fanout import fanout
+from brawler.routing import routing
+from brawler.window import window_id
+from brawler.logging import log, key_log
+
+# core and extension events are 32 bytes, only generic events can be longer
+EVENT_SIZE = 32
+GENERIC_EVENT = 35
+# extra length of a generic event in 4 byte units, at bytes 4-8 of the event,
+# Xlib talks to the server in native byte order
+GENERIC_LENGTH = struct.Struct("=I")
+
+
+def key_presses(data):
+    # walk the recorded events in place and return the keycodes of all key
+    # presses, without slicing the buffer or building event objects
+    view = memoryview(data)
+    keycodes = []
+    offset = 0
+    end = len(view)
+    while offset < end:
+        # the high bit marks events sent with SendEvent
+        event_type = view[offset] & 0x7F
+        if event_type == X.KeyPress:
+            keycodes.append(view[offset + 1])
+            offset += EVENT_SIZE
+        elif event_type == GENERIC_EVENT:
+            (length,) = GENERIC_LENGTH.unpack_from(view, offset + 4)
+            offset += EVENT_SIZE + 4 * length
+        else:
+            offset += EVENT_SIZE
+    return keycodes
+
+
+CAPTURE_MODES = ("record", "grab")
 
 
 class duplicator:
-    def __init__(self, clients, keys):
+    def __init__(
+        self,
+        clients,
+        keys,
+        queue_size=64,
+        queue_policy="drop_oldest",
+        capture="record",
+        routes=None,
+        trace=None,
+    ):
+        if capture not in CAPTURE_MODES:
+            log.error("unknown capture mode {}, using record".format(capture))
+            capture = "record"
+
         self.clients = clients
-        self.keys = keys
+        self.keys = set(keys)
+        self.capture = capture
+        self.routing = routes if routes is not None else routing()
+        self.recorded = 0
+        self.paused = False
+        # times the listener woke up, to compare the capture modes
+        self.wakeups = 0
+        # optional trace_writer for the recorded keys and their injection
+        self.trace = trace
+        # Only sent the duplicated keys to the toons, so we need to exclude 0
+        self.fanout = fanout(self.clients[1:], queue_size, queue_policy, trace)
+        # the record context is controlled on disp, its data arrives on data
         self.disp = Display()
+        self.data = Display()
         self.root = self.disp.screen().root
+        self.is_running = False
+        # written to on stop() to wake up the select loop
+        self.wakeup = os.pipe()
+        # the window holding the passive grabs, moved when the master changes
+        self.grabbed = None
+        self.regrab = False
+        self.table = self.build_table()
+        self.routes = self.compile()
+        self.ctx = None
+        if self.capture == "record":
+            self.create_context()
+
+    def create_context(self):
         self.ctx = self.disp.record_create_context(
             0,
             [record.AllClients],
@@ -50,12 +126,121 @@ class duplicator:
                 }
             ],
         )
-        self.disp.record_enable_context(self.ctx, self.duplicate)
-        self.disp.record_free_context(self.ctx)
 
-    def listen(self):
-        # start listening for next key event
-        event = self.root.display.next_event()
+    def grab_window(self):
+        # the master's virtual desktop contains the window that has the focus
+        master = self.clients[0]
+        return self.disp.create_resource_object(
+            "window", window_id(master.virtual_desktop)
+        )
+
+    def grab(self):
+        # passive grabs for the allowed keys only, so the server doesn't wake us
+        # for anything else. The keyboard is frozen on a grabbed key press until
+        # we replay it to the master in handle_event.
+        window = self.grab_window()
+        for keycode, key_string in enumerate(self.table):
+            if key_string is not None:
+                window.grab_key(
+                    keycode, X.AnyModifier, True, X.GrabModeAsync, X.GrabModeSync
+                )
+        self.disp.flush()
+        self.grabbed = window
+
+    def ungrab(self):
+        if self.grabbed is None:
+            return
+        # the window may be gone already, its grabs went with it
+        self.grabbed.ungrab_key(X.AnyKey, X.AnyModifier, onerror=lambda *args: None)
+        self.disp.flush()
+        self.grabbed = None
+
+    def master_changed(self):
+        # the master got replaced, move the grabs to its window from the
+        # listener thread, which owns disp
+        if self.capture == "grab" and self.is_running:
+            self.regrab = True
+            os.write(self.wakeup[1], b"\0")
+
+    def enable(self):
+        # like record_enable_context, but don't block until the context is
+        # disabled, the replies are read in run() as they arrive
+        record.EnableContext(
+            callback=self.duplicate,
+            display=self.data.display,
+            defer=True,
+            opcode=self.data.display.get_extension_major(record.extname),
+            context=self.ctx,
+        )
+        self.data.flush()
+
+    def run(self):
+        log.debug("start listening for key input using {}".format(self.capture))
+        self.is_running = True
+        fds = [self.disp.fileno(), self.wakeup[0]]
+        if self.capture == "record":
+            self.enable()
+            fds.append(self.data.fileno())
+        else:
+            self.grab()
+
+        while self.is_running:
+            # parses all record replies we got and calls duplicate for each
+            self.data.pending_events()
+            while self.disp.pending_events():
+                self.handle_event(self.disp.next_event())
+            # sleep until the server sends something or we get stopped
+            readable, _, _ = select.select(fds, [], [])
+            self.wakeups += 1
+            if self.wakeup[0] in readable:
+                os.read(self.wakeup[0], 64)
+            if self.regrab and self.is_running:
+                log.debug("master changed, moving the key grabs")
+                self.regrab = False
+                self.ungrab()
+                self.grab()
+
+        if self.capture == "record":
+            self.disp.record_disable_context(self.ctx)
+            self.disp.record_free_context(self.ctx)
+        else:
+            self.ungrab()
+        self.disp.close()
+        self.data.close()
+        log.debug("stopped listening for key input")
+
+    def stop(self):
+        self.is_running = False
+        os.write(self.wakeup[1], b"\0")
+
+    def handle_event(self, event):
+        if event.type == X.MappingNotify and event.request != X.MappingPointer:
+            # the keyboard got remapped (e.g. xmodmap), rebuild our lookup table
+            log.debug("keyboard mapping changed, rebuilding key table")
+            self.disp.refresh_keyboard_mapping(event)
+            if self.capture == "grab":
+                self.ungrab()
+            self.table = self.build_table()
+            self.routes = self.compile()
+            if self.capture == "grab":
+                self.grab()
+            for injector in {c.injector for c in self.clients}:
+                injector.refresh()
+        elif event.type == X.KeyPress and self.capture == "grab":
+            # let the master have the key as well, then duplicate it
+            self.disp.allow_events(X.ReplayKeyboard, event.time)
+            self.disp.flush()
+            self.duplicate_key(event.detail, time.perf_counter())
+
+    def build_table(self):
+        # keycode -> key string sent to the toons, None for keys we don't duplicate
+        table = [None] * 256
+        info = self.disp.display.info
+        for keycode in range(info.min_keycode, info.max_keycode + 1):
+            key_string = self.decode_keycode(keycode)
+            if key_string in self.keys:
+                table[keycode] = key_string
+        return table
 
     def decode_keycode(self, keycode):
         # try to decode the keycode to a string
@@ -69,15 +254,52 @@ class duplicator:
 
     def duplicate(self, reply):
         # duplicate the key input to all clients
-        data = reply.data
-        while len(data):
-            event, data = rq.EventField(None).parse_binary_value(
-                data, self.disp.display, None, None
-            )
-            if event.type == X.KeyPress:
-                key_string = self.decode_keycode(event.detail)
-                log.debug("Pressed key: {}, code: {}".format(key_string, event.detail))
-                if key_string in self.keys:
-                    # Only sent the duplicated keys to the toons, so we need to exclude 0
-                    for c in self.clients[1:]:
-                        c.send_key(key_string)
+        recorded = time.perf_counter()
+        for keycode in key_presses(reply.data):
+            self.duplicate_key(keycode, recorded)
+
+    def compile(self):
+        queues = [self.fanout.queue(c) for c in self.clients[1:]]
+        return self.routing.compile(self.table, queues)
+
+    def set_routing(self, routes):
+        # swapping the compiled table is atomic for the listener thread
+        self.routing = routes
+        self.routes = self.compile()
+
+    def set_trace(self, trace):
+        self.fanout.set_trace(trace)
+        self.trace = trace
+
+    def add_client(self, client):
+        self.fanout.add(client)
+        self.routes = self.compile()
+
+    def remove_client(self, client):
+        self.fanout.remove(client)
+        self.routes = self.compile()
+
+    def duplicate_key(self, keycode, recorded):
+        targets = self.routes[keycode]
+        if targets is not None:
+            self.dispatch(keycode, recorded, targets)
+
+    def dispatch(self, keycode, recorded, targets):
+        if not self.paused:
+            key_log.debug("Pressed key: %s, code: %s", self.table[keycode], keycode)
+            # hand the key to the per toon queues, so we return right away
+            self.recorded += 1
+            trace = self.trace
+            seq = trace.key(keycode, recorded, targets) if trace is not None else None
+            for queue, key_string in targets:
+                queue.put(key_string, recorded, seq)
+
+    def duplicate_targets(self, keycode, recorded, targets):
+        # send (client id, key) pairs as they are, e.g. from a recorded trace,
+        # bypassing keys_allowed and the toon profiles
+        queues = {q.client.id: q for q in self.fanout.queues}
+        self.dispatch(
+            keycode,
+            recorded,
+            [(queues[id], key) for id, key in targets if id in queues],
+        )
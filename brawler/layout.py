@@ -0,0 +1,129 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+from functools import lru_cache
+
+PRESETS = ("master_stack", "columns", "grid")
+# width / height of the master and of grid cells
+ASPECT = 4 / 3
+# toons aren't squeezed into strips narrower than this next to the master
+MIN_TOON_WIDTH = 320
+
+
+def topology(monitors):
+    # hashable description of the monitors, primary first, then left to right
+    result = [(m.x, m.y, m.width, m.height, bool(m.is_primary)) for m in monitors]
+    return tuple(sorted(result, key=lambda m: (not m[4], m[0], m[1])))
+
+
+def split(start, length, count):
+    # integer offsets and lengths of count parts without gaps between them
+    edges = [start + length * i // count for i in range(count + 1)]
+    return [(edges[i], edges[i + 1] - edges[i]) for i in range(count)]
+
+
+def grid_columns(width, height, count):
+    # the number of columns that gives cells closest to ASPECT
+    best = None
+    for columns in range(1, count + 1):
+        rows = math.ceil(count / columns)
+        error = abs(math.log((width / columns) / (height / rows) / ASPECT))
+        if best is None or error < best[0]:
+            best = (error, columns)
+    return best[1]
+
+
+def distribute(regions, count):
+    # toons per region in proportion to its area, largest remainder first
+    areas = [w * h for x, y, w, h in regions]
+    total = sum(areas)
+    shares = [count * a / total for a in areas]
+    result = [int(s) for s in shares]
+    rest = sorted(
+        range(len(regions)), key=lambda i: shares[i] - result[i], reverse=True
+    )
+    for i in rest[: count - sum(result)]:
+        result[i] += 1
+    return result
+
+
+def tile(region, count, preset, columns):
+    # (width, height, x, y) of count tiles filling a region column by column
+    x, y, width, height = region
+    if preset == "master_stack":
+        cols = 1
+    elif preset == "columns":
+        cols = min(columns, count)
+    else:
+        cols = grid_columns(width, height, count)
+    rows = math.ceil(count / cols)
+    tiles = []
+    for cx, cw in split(x, width, cols):
+        for ry, rh in split(y, height, rows):
+            if len(tiles) < count:
+                tiles.append((cw, rh, cx, ry))
+    return tiles
+
+
+@lru_cache(maxsize=64)
+def compute(
+    monitors,
+    toons,
+    preset="master_stack",
+    aspect=ASPECT,
+    panel=0,
+    columns=2,
+    min_width=MIN_TOON_WIDTH,
+):
+    # (id, width, height, x, y) for the master and every toon. The master goes
+    # on the first monitor, aspect None makes it fill that monitor, the toons
+    # are tiled over the rest of it if that is at least min_width wide and over
+    # all other monitors.
+    if len(monitors) == 0:
+        raise ValueError("no monitors found")
+    if preset not in PRESETS:
+        raise ValueError("unknown layout {}".format(preset))
+
+    mx, my, mw, mh, primary = monitors[0]
+    others = [(x, y, w, h) for x, y, w, h, p in monitors[1:]]
+    if aspect is None and len(others) == 0:
+        # a single monitor can't be left to the master alone
+        aspect = ASPECT
+    height = mh - panel
+    width = mw if aspect is None else min(mw, int(height * aspect))
+    if toons > 0 and len(others) == 0 and mw - width < min_width <= mw - min_width:
+        # nowhere else to put the toons, make the master narrower instead
+        width = mw - min_width
+    regions = []
+    if mw - width >= min_width:
+        regions.append((mx + width, my, mw - width, mh))
+    regions += others
+    if len(regions) == 0:
+        # the monitor is too narrow for the master and the toons side by side
+        regions.append((mx, my, mw, mh))
+
+    layout = [(0, width, height, mx, my)]
+    if toons > 0:
+        for region, count in zip(regions, distribute(regions, toons)):
+            if count > 0:
+                for w, h, x, y in tile(region, count, preset, columns):
+                    layout.append((len(layout), w, h, x, y))
+    return tuple(layout)
@@ -18,15 +18,110 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
+import time
 
 from brawler import config
 
+# records are handed to a listener thread, so writing to the terminal never
+# blocks the input and send queue threads
+QUEUE_SIZE = 10000
+
+
+class queue_handler(logging.handlers.QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the listener formats the record, not the thread that logged it
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class key_filter(logging.Filter):
+    # lets at most rate per key messages through per second and reports how
+    # many were suppressed, 0 lets everything through
+
+    def __init__(self, rate=20):
+        super().__init__()
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.window = 0.0
+        self.passed = 0
+        self.suppressed = 0
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window >= 1:
+                suppressed = self.suppressed
+                self.window = now
+                self.passed = 0
+                self.suppressed = 0
+            else:
+                suppressed = 0
+            self.passed += 1
+            if self.passed > self.rate:
+                self.suppressed += 1
+                return False
+        if suppressed:
+            log.info("%d key messages suppressed", suppressed)
+        return True
+
+
 log = logging.getLogger("")
+# per key messages on the input path, sampled by key_filter
+key_log = logging.getLogger("brawler.keys")
+
 log.setLevel(config.LOGLEVEL)
+ch = logging.StreamHandler()
+ch.setLevel(config.LOGLEVEL)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+ch.setFormatter(formatter)
+handler = queue_handler(queue.Queue(QUEUE_SIZE))
+listener = logging.handlers.QueueListener(handler.queue, ch, respect_handler_level=True)
+running = False
 if len(log.handlers) < 1:
-    ch = logging.StreamHandler()
-    ch.setLevel(config.LOGLEVEL)
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    ch.setFormatter(formatter)
-    log.addHandler(ch)
+    log.addHandler(handler)
+    listener.start()
+    running = True
+key_sampler = key_filter()
+key_log.addFilter(key_sampler)
+
+
+def stop():
+    # write out what is still queued, also done on exit
+    global running
+    if running:
+        running = False
+        listener.stop()
+
+
+atexit.register(stop)
+
+
+def set_level(level):
+    # change the log level at runtime, e.g. "DEBUG" or logging.DEBUG
+    if isinstance(level, str):
+        level = level.upper()
+    log.setLevel(level)
+    ch.setLevel(level)
+    config.LOGLEVEL = logging.getLevelName(log.level)
+    log.info("log level set to %s", config.LOGLEVEL)
+    return config.LOGLEVEL
+
+
+def set_key_rate(rate):
+    key_sampler.rate = rate
@@ -0,0 +1,164 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+import fcntl
+import shutil
+
+from brawler.logging import log
+
+# ioctl to share the data blocks of a file (btrfs, xfs, ...), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+# files that must never be shared, wine rewrites them and they contain prefix paths
+REGISTRY = ("system.reg", "user.reg", "userdef.reg")
+MODES = ("reflink", "hardlink", "copy")
+
+
+def reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def clone_file(src, dst, mode):
+    # clone a single file, returns the mode that actually worked so the
+    # caller doesn't retry a mode the filesystem doesn't support
+    if mode == "reflink":
+        try:
+            reflink(src, dst)
+            return mode
+        except OSError as e:
+            log.debug("reflink not supported ({}), falling back to hardlinks".format(e))
+            if os.path.exists(dst):
+                os.unlink(dst)
+            mode = "hardlink"
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError as e:
+            log.debug("hardlinks not supported ({}), falling back to copies".format(e))
+            mode = "copy"
+    shutil.copy2(src, dst)
+    return mode
+
+
+def rewrite_registry(src, dst, template, target):
+    # the registry references the prefix in unix form and as Z:\ path with
+    # escaped backslashes, point both to the new prefix
+    with open(src, "r", encoding="utf-8", errors="surrogateescape") as f:
+        data = f.read()
+    for old, new in (
+        (template, target),
+        (template.replace("/", "\\\\"), target.replace("/", "\\\\")),
+    ):
+        data = data.replace(old, new)
+    with open(dst, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(data)
+    shutil.copystat(src, dst)
+
+
+def clone(template, target, mode="reflink", private=(), final=None):
+    # final is where the clone will live in the end, paths are rewritten to it
+    template = os.path.abspath(template)
+    target = os.path.abspath(target)
+    final = os.path.abspath(final) if final else target
+    if mode not in MODES:
+        log.error("unknown prefix clone mode {}, using reflink".format(mode))
+        mode = "reflink"
+    private = set(private)
+
+    for root, dirs, files in os.walk(template):
+        rel = os.path.relpath(root, template)
+        dst_root = os.path.normpath(os.path.join(target, rel))
+        os.makedirs(dst_root, exist_ok=True)
+        shutil.copystat(root, dst_root)
+
+        for name in dirs + files:
+            src = os.path.join(root, name)
+            dst = os.path.join(dst_root, name)
+            rel_name = os.path.normpath(os.path.join(rel, name))
+
+            if os.path.islink(src):
+                link = os.readlink(src)
+                # dosdevices may point into the template, keep them inside the clone
+                if os.path.isabs(link) and (
+                    link == template or link.startswith(template + os.sep)
+                ):
+                    link = final + link[len(template) :]
+                os.symlink(link, dst)
+            elif name in dirs:
+                continue
+            elif name in REGISTRY and rel == ".":
+                rewrite_registry(src, dst, template, final)
+            elif rel_name in private:
+                shutil.copy2(src, dst)
+            else:
+                mode = clone_file(src, dst, mode)
+
+        # os.walk doesn't descend into symlinked directories, they are links here
+        dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(root, d))]
+
+    return mode
+
+
+def inside(path, parent):
+    path = os.path.realpath(path)
+    parent = os.path.realpath(parent)
+    return path == parent or path.startswith(parent + os.sep)
+
+
+def check_template(template, base):
+    # a template among the client prefixes would be deleted by a reset and
+    # cloned from itself, e.g. pointing it at the installed client_0 prefix
+    rel = os.path.relpath(os.path.realpath(template), os.path.realpath(base))
+    if rel == "." or rel.split(os.sep)[0].startswith("client_"):
+        raise ValueError(
+            "wine_prefix_template {} can't be {} or one of its client prefixes, "
+            "copy it out of there first".format(template, base)
+        )
+
+
+def ensure_prefix(template, target, mode="reflink", private=(), reset=False):
+    # materialize the prefix from the template if it doesn't exist yet
+    if inside(template, target) or inside(target, template):
+        raise ValueError(
+            "can't create prefix {} from template {}".format(target, template)
+        )
+    if reset and os.path.exists(target):
+        log.info("resetting prefix {}".format(target))
+        shutil.rmtree(target)
+    if os.path.exists(target):
+        return target
+
+    start = time.monotonic()
+    tmp = "{}.tmp".format(target)
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    # clone next to the target and rename, so we never use a half cloned prefix
+    used = clone(template, tmp, mode, private, target)
+    os.rename(tmp, target)
+    log.info(
+        "created prefix {} from {} using {} in {:.2f}s".format(
+            target, template, used, time.monotonic() - start
+        )
+    )
+    return target
@@ -18,6 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import time
 import subprocess
 from shlex import quote
@@ -51,3 +52,63 @@ def shell(cmd, env=None):
         log.debug("shell executed successfully: {}".format(proc.pid))
 
     return proc
+
+
+def spawn(args, env=None):
+    # start a process in its own session and process group, so it and every
+    # child it forks can be signalled at once with killpg
+    proc = None
+
+    try:
+        proc = subprocess.Popen(
+            args,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError as error:
+        log.error("error while spawning {}: {}".format(args[0], error))
+    else:
+        log.debug("process spawned successfully: {}".format(proc.pid))
+
+    return proc
+
+
+def signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_stat(pid):
+    # fields of /proc/<pid>/stat after the command name, which may contain spaces
+    with open("/proc/{}/stat".format(pid), "rb") as f:
+        data = f.read()
+    return data[data.rindex(b")") + 2 :].split()
+
+
+def group_pids(pgid):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            if int(read_stat(entry)[2]) == pgid:
+                pids.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return pids
@@ -0,0 +1,234 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+
+from brawler.process import execute
+from brawler.logging import log
+
+# the master client, all toon clients and the brawler process itself
+ROLES = ("master", "toons", "brawler")
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+# cgroup v2 cpu.max period in microseconds
+CPU_PERIOD = 100000
+
+
+def parse_cpus(cpus):
+    # a list of cpus, a single cpu or a cpu list like "0-3,8"
+    if cpus is None:
+        return None
+    if isinstance(cpus, int):
+        return {cpus}
+    if isinstance(cpus, (list, tuple, set)):
+        return set(int(c) for c in cpus)
+    result = set()
+    for part in str(cpus).split(","):
+        first, _, last = part.strip().partition("-")
+        result.update(range(int(first), int(last or first) + 1))
+    return result
+
+
+def parse_ionice(ionice):
+    # "idle", "best-effort" or "best-effort:7" -> (class, level)
+    if ionice is None:
+        return None
+    name, _, level = str(ionice).partition(":")
+    if name not in IONICE_CLASSES:
+        raise ValueError("unknown ionice class {}".format(name))
+    return IONICE_CLASSES[name], int(level) if level else None
+
+
+class policy:
+    def __init__(
+        self, cpus=None, nice=None, ionice=None, cpu_max=None, memory_max=None
+    ):
+        self.cpus = parse_cpus(cpus)
+        self.nice = nice
+        self.ionice = parse_ionice(ionice)
+        # cores the role may use in total and its memory limit, e.g. 2.5 and "8G"
+        self.cpu_max = cpu_max
+        self.memory_max = memory_max
+
+    def update(self, **changes):
+        self.__init__(
+            changes.get("cpus", self.cpus),
+            changes.get("nice", self.nice),
+            changes.get("ionice", self.ionice_name()),
+            changes.get("cpu_max", self.cpu_max),
+            changes.get("memory_max", self.memory_max),
+        )
+
+    def ionice_name(self):
+        if self.ionice is None:
+            return None
+        names = {v: k for k, v in IONICE_CLASSES.items()}
+        cls, level = self.ionice
+        return names[cls] if level is None else "{}:{}".format(names[cls], level)
+
+    def has_limits(self):
+        return self.cpu_max is not None or self.memory_max is not None
+
+    def ionice_args(self):
+        cls, level = self.ionice
+        args = ["ionice", "-c", str(cls)]
+        if level is not None:
+            args += ["-n", str(level)]
+        return args
+
+    def describe(self):
+        return {
+            "cpus": sorted(self.cpus) if self.cpus is not None else None,
+            "nice": self.nice,
+            "ionice": self.ionice_name(),
+            "cpu_max": self.cpu_max,
+            "memory_max": self.memory_max,
+        }
+
+
+class resources:
+    def __init__(self, policies=None, cgroup_parent=None):
+        self.policies = policies or {}
+        # a delegated cgroup v2 directory, brawler creates one cgroup per role in it
+        self.cgroup_parent = cgroup_parent
+        self.cgroups = {}
+
+    @classmethod
+    def from_config(cls, config):
+        policies = {}
+        for role, settings in (config.get("resources") or {}).items():
+            if role not in ROLES:
+                raise ValueError("unknown resource role {}".format(role))
+            policies[role] = policy(**(settings or {}))
+        return cls(policies, config.get("cgroup_parent"))
+
+    def reload(self, config):
+        # take the policies from a new config, limits of existing cgroups are
+        # rewritten and removed ones reset
+        fresh = self.from_config(config)
+        self.policies = fresh.policies
+        for role, path in self.cgroups.items():
+            self.write_limits(path, self.policies.get(role) or policy())
+
+    def describe(self):
+        return {role: p.describe() for role, p in self.policies.items()}
+
+    def policy(self, role):
+        return self.policies.get(role)
+
+    def set(self, role, **changes):
+        if role not in ROLES:
+            raise ValueError("unknown resource role {}".format(role))
+        if role not in self.policies:
+            self.policies[role] = policy()
+        self.policies[role].update(**changes)
+        if role in self.cgroups:
+            self.write_limits(self.cgroups[role], self.policies[role])
+        return self.policies[role]
+
+    def cgroup(self, role):
+        # create the cgroup of a role on first use, None without limits
+        p = self.policy(role)
+        if p is None or not p.has_limits():
+            return None
+        if self.cgroup_parent is None:
+            log.warning("cpu_max/memory_max for {} need cgroup_parent".format(role))
+            return None
+        if role not in self.cgroups:
+            path = os.path.join(self.cgroup_parent, role)
+            try:
+                self.enable_controllers()
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                log.error("can't create cgroup {}: {}".format(path, e))
+                return None
+            self.cgroups[role] = path
+            self.write_limits(path, p)
+        return self.cgroups[role]
+
+    def enable_controllers(self):
+        with open(os.path.join(self.cgroup_parent, "cgroup.subtree_control"), "w") as f:
+            f.write("+cpu +memory")
+
+    def write_limits(self, path, p):
+        limits = {
+            "cpu.max": (
+                "max"
+                if p.cpu_max is None
+                else "{} {}".format(int(float(p.cpu_max) * CPU_PERIOD), CPU_PERIOD)
+            ),
+            "memory.max": "max" if p.memory_max is None else str(p.memory_max),
+        }
+        for name, value in limits.items():
+            try:
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(value)
+            except OSError as e:
+                log.error("can't set {} to {} for {}: {}".format(name, value, path, e))
+
+    def launch(self, role, args):
+        # wrap the command so the settings apply from its first instruction on
+        # and are inherited by every process the client starts, the wrappers
+        # exec into each other so the pid stays the one of the process group
+        p = self.policy(role)
+        if p is None:
+            return list(args)
+        args = list(args)
+        if p.ionice is not None:
+            args = p.ionice_args() + ["--"] + args
+        if p.nice is not None:
+            # nice is relative to the niceness of the launching thread
+            nice = p.nice - os.getpriority(os.PRIO_PROCESS, 0)
+            args = ["nice", "-n", str(nice), "--"] + args
+        if p.cpus is not None:
+            cpus = ",".join(str(c) for c in sorted(p.cpus))
+            args = ["taskset", "-c", cpus, "--"] + args
+        cgroup = self.cgroup(role)
+        if cgroup is not None:
+            # move the shell into the cgroup, then exec the command in it
+            procs = os.path.join(cgroup, "cgroup.procs")
+            args = ["sh", "-c", 'echo $$ > "$0"; exec "$@"', procs] + args
+        return args
+
+    def apply(self, role, pids):
+        # apply the policy of a role to already running processes or threads
+        p = self.policy(role)
+        if p is None or len(pids) == 0:
+            return
+        cgroup = self.cgroup(role)
+        for pid in pids:
+            try:
+                if cgroup is not None:
+                    with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                        f.write(str(pid))
+                if p.cpus is not None:
+                    os.sched_setaffinity(pid, p.cpus)
+                if p.nice is not None:
+                    os.setpriority(os.PRIO_PROCESS, pid, p.nice)
+            except ProcessLookupError:
+                continue
+            except OSError as e:
+                log.error("can't apply {} resources to {}: {}".format(role, pid, e))
+        if p.ionice is not None:
+            execute(" ".join(p.ionice_args() + ["-p"] + [str(pid) for pid in pids]))
+        log.debug("applied {} resources to {} processes".format(role, len(pids)))
+
+    def apply_self(self):
+        # every thread of the brawler process, the input thread included
+        self.apply("brawler", [int(t) for t in os.listdir("/proc/self/task")])
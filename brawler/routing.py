@@ -0,0 +1,112 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import itertools
+
+from brawler.logging import log
+
+
+class profile:
+    def __init__(self, name, remap=None, groups=None):
+        self.name = name
+        self.remap = {str(k): str(v) for k, v in (remap or {}).items()}
+        self.groups = set(groups or [])
+
+
+class routing:
+    # which toon gets which key: every toon can have a profile with a remap
+    # table and group memberships, keys listed in key_groups only go to toons
+    # in one of those groups, all other keys go to every toon
+
+    def __init__(self, profiles=None, toon_profiles=None, key_groups=None):
+        self.profiles = {
+            name: profile(name, p.get("remap"), p.get("groups"))
+            for name, p in (profiles or {}).items()
+        }
+        self.toon_profiles = list(toon_profiles or [])
+        # client id -> position in toon_profiles, pinned the first time a toon
+        # is routed, so toons keep their profile when toons before them leave
+        self.pinned = {}
+        self.key_groups = {str(k): set(v) for k, v in (key_groups or {}).items()}
+        self.default = profile("default")
+
+        for name in self.toon_profiles:
+            if name is not None and name not in self.profiles:
+                log.error("unknown profile {}, using the default".format(name))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get("profiles"),
+            config.get("toon_profiles"),
+            config.get("key_groups"),
+        )
+
+    def profile(self, toon):
+        # toon is the position in toon_profiles, starting at 0 for the first toon
+        if toon < len(self.toon_profiles):
+            return self.profiles.get(self.toon_profiles[toon], self.default)
+        return self.default
+
+    def pin(self, clients):
+        # new toons get the first position no other toon is pinned to
+        used = {self.pinned[c.id] for c in clients if c.id in self.pinned}
+        free = (i for i in itertools.count() if i not in used)
+        for c in clients:
+            if c.id not in self.pinned:
+                self.pinned[c.id] = next(free)
+
+    def replace(self, old, new):
+        # a replacement takes over the profile of the client it replaces
+        if old.id in self.pinned:
+            self.pinned[new.id] = self.pinned.pop(old.id)
+
+    def keep(self, other):
+        # take over the pinned positions of the routing this one replaces
+        self.pinned = dict(other.pinned)
+
+    def route(self, key_string, toon):
+        # the key to send to this toon, or None if it doesn't get this key
+        p = self.profile(toon)
+        groups = self.key_groups.get(key_string)
+        if groups is not None and not groups & p.groups:
+            return None
+        return p.remap.get(key_string, key_string)
+
+    def compile(self, table, queues):
+        # keycode -> tuple of (send queue, key string), None if nobody gets the
+        # key, so routing a key press stays a single lookup. queues are the send
+        # queues of the toons in toon order.
+        self.pin([q.client for q in queues if q is not None])
+        routes = [None] * len(table)
+        for keycode, key_string in enumerate(table):
+            if key_string is None:
+                continue
+            targets = []
+            for queue in queues:
+                if queue is None:
+                    # toon is being replaced and has no send queue right now
+                    continue
+                out = self.route(key_string, self.pinned[queue.client.id])
+                if out is not None:
+                    targets.append((queue, out))
+            if targets:
+                routes[keycode] = tuple(targets)
+        return routes
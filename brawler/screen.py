@@ -18,32 +18,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from screeninfo import get_monitors
-
 from brawler.logging import log
 
-monitors = get_monitors()
-
+# monitors are only probed on first use and cached afterwards
+monitors = None
 
-def calculate_offset():
-    log.debug("calculating screen offset, if there are multiple monitors")
-    offset = 0
-    if len(monitors) > 1:
-        for m in monitors:
-            if m.x > 0 and m.is_primary:
-                offset = m.x
-                log.debug("offset found: {}".format(offset))
-    return offset
 
+def get_monitors():
+    global monitors
+    if monitors is None:
+        from screeninfo import get_monitors
 
-def get_primary_resolution():
-    res_x = 0
-    res_y = 0
+        monitors = get_monitors()
+        log.debug("monitors found: {}".format(monitors))
+    return monitors
 
-    for m in monitors:
-        if m.is_primary:
-            res_x = m.width
-            res_y = m.height
 
-    log.debug("screen size: {}x{}".format(res_x, res_y))
-    return res_x, res_y
+def reset():
+    # forget the probed monitors, e.g. after the RandR configuration changed
+    global monitors
+    monitors = None
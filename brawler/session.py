@@ -0,0 +1,70 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import threading
+
+from brawler.logging import log
+
+VERSION = 1
+lock = threading.Lock()
+
+
+def client_state(client):
+    return {
+        "id": client.id,
+        "name": client.name,
+        "display": client.display,
+        "virtual_desktop": client.virtual_desktop,
+        "window": client.window,
+        "pid": client.pid,
+        "pgid": client.pgid,
+        "resolution_x": client.resolution_x,
+        "resolution_y": client.resolution_y,
+        "position_x": client.position_x,
+        "position_y": client.position_y,
+    }
+
+
+def save(path, clients, spares):
+    # write to a temporary file and rename, so a crash never leaves half a file
+    state = {
+        "version": VERSION,
+        "clients": [client_state(c) for c in clients],
+        "spares": [client_state(c) for c in spares],
+    }
+    with lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = "{}.tmp".format(path)
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, path)
+    log.debug("session saved to {}".format(path))
+
+
+def load(path):
+    with open(path, "r") as f:
+        state = json.load(f)
+    if state.get("version") != VERSION:
+        raise ValueError(
+            "unsupported session file version {}".format(state.get("version"))
+        )
+    return state
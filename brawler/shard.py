@@ -0,0 +1,122 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+import threading
+import multiprocessing
+
+from brawler.logging import log
+
+# keys for toons on another X display are injected by a worker process owning
+# that display, the master sends one message per batch of keys:
+#   window id (u32), key count (u8), then per key its length (u8) and name
+HEADER = struct.Struct("=IB")
+# a message for window 0 asks the worker to reload its keyboard mapping
+REFRESH = 0
+
+
+def pack(window, keys):
+    data = [HEADER.pack(window, len(keys))]
+    for key in keys:
+        name = key.encode()
+        data.append(struct.pack("=B", len(name)))
+        data.append(name)
+    return b"".join(data)
+
+
+def unpack(data):
+    window, count = HEADER.unpack_from(data)
+    offset = HEADER.size
+    keys = []
+    for i in range(count):
+        length = data[offset]
+        keys.append(bytes(data[offset + 1 : offset + 1 + length]).decode())
+        offset += 1 + length
+    return window, keys
+
+
+def worker(display, conn, backend):
+    # runs in its own process, so injection on every display gets its own core
+    from brawler.inject import get_injector
+    from brawler.logging import stop
+
+    injector = get_injector(backend, display)
+    log.debug("injection worker for {} started".format(display))
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            break
+        window, keys = unpack(data)
+        if window == REFRESH:
+            injector.refresh()
+            continue
+        try:
+            injector.send_keys(window, keys)
+        except Exception as e:
+            log.error("{}: failed to send keys: {}".format(display, e))
+    log.debug("injection worker for {} stopped".format(display))
+    # worker processes exit without running atexit handlers
+    stop()
+
+
+class remote_injector:
+    name = "remote"
+
+    def __init__(self, display, backend="xlib"):
+        from brawler.window import window_id
+
+        self.window_id = window_id
+        self.display = display
+        self.lock = threading.Lock()
+        # spawn instead of fork, the master already runs X and queue threads
+        context = multiprocessing.get_context("spawn")
+        reader, self.conn = context.Pipe(duplex=False)
+        self.proc = context.Process(
+            target=worker,
+            args=(display, reader, backend),
+            name="inject_{}".format(display),
+            daemon=True,
+        )
+        self.proc.start()
+        reader.close()
+
+    def send(self, data):
+        with self.lock:
+            self.conn.send_bytes(data)
+
+    def send_key(self, window, key):
+        self.send(pack(self.window_id(window), [key]))
+
+    def send_keys(self, window, keys):
+        # the key count is a single byte
+        for i in range(0, len(keys), 255):
+            self.send(pack(self.window_id(window), keys[i : i + 255]))
+
+    def refresh(self):
+        self.send(pack(REFRESH, []))
+
+    def stop(self, timeout=2):
+        # closing the pipe ends the worker loop
+        with self.lock:
+            self.conn.close()
+        self.proc.join(timeout)
+        if self.proc.is_alive():
+            self.proc.terminate()
@@ -0,0 +1,200 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import threading
+from collections import deque
+
+from brawler.logging import log
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class latency:
+    # rolling window over the last samples, recording is a single append so it
+    # can stay enabled on the input path, percentiles are only computed on export
+
+    def __init__(self, size=1024):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+        summary = {"count": self.count, "sum": self.total}
+        for q in QUANTILES:
+            summary["p{}".format(int(q * 100))] = (
+                samples[min(int(len(samples) * q), len(samples) - 1)]
+                if samples
+                else 0.0
+            )
+        summary["max"] = samples[-1] if samples else 0.0
+        return summary
+
+
+def metric(lines, name, kind, help, values):
+    lines.append("# HELP {} {}".format(name, help))
+    lines.append("# TYPE {} {}".format(name, kind))
+    for labels, value in values:
+        label = ",".join('{}="{}"'.format(k, v) for k, v in labels.items())
+        if label:
+            lines.append("{}{{{}}} {}".format(name, label, value))
+        else:
+            lines.append("{} {}".format(name, value))
+
+
+def render(stats):
+    # render controller stats in the prometheus text exposition format
+    lines = []
+    queues = stats.get("queues", {})
+
+    if "recorded" in stats:
+        metric(
+            lines,
+            "brawler_keys_recorded_total",
+            "counter",
+            "Allowed keys recorded on the master",
+            [({}, stats["recorded"])],
+        )
+    if "wakeups" in stats:
+        metric(
+            lines,
+            "brawler_listener_wakeups_total",
+            "counter",
+            "Times the key listener was woken up by the X server",
+            [({}, stats["wakeups"])],
+        )
+
+    for name, key, kind, help in (
+        ("brawler_queue_depth", "depth", "gauge", "Keys waiting in the send queue"),
+        ("brawler_keys_sent_total", "sent", "counter", "Keys sent to the toon"),
+        (
+            "brawler_keys_dropped_total",
+            "dropped",
+            "counter",
+            "Keys dropped by the queue overflow policy",
+        ),
+    ):
+        metric(
+            lines,
+            name,
+            kind,
+            help,
+            [({"client": c}, q[key]) for c, q in queues.items()],
+        )
+
+    for name, help in (
+        ("latency", "Time from recording a key to injecting it into the toon"),
+        ("wait", "Time a key spent in the send queue"),
+    ):
+        values = []
+        for c, q in queues.items():
+            summary = q[name]
+            for quantile in QUANTILES:
+                values.append(
+                    (
+                        {"client": c, "quantile": quantile},
+                        summary["p{}".format(int(quantile * 100))],
+                    )
+                )
+        metric(lines, "brawler_key_{}_seconds".format(name), "summary", help, values)
+        for suffix in ("count", "sum"):
+            for c, q in queues.items():
+                lines.append(
+                    'brawler_key_{}_seconds_{}{{client="{}"}} {}'.format(
+                        name, suffix, c, q[name][suffix]
+                    )
+                )
+        metric(
+            lines,
+            "brawler_key_{}_max_seconds".format(name),
+            "gauge",
+            "Slowest of the recent samples",
+            [({"client": c}, q[name]["max"]) for c, q in queues.items()],
+        )
+
+    telemetry = (stats.get("telemetry") or {}).get("clients", {})
+    for name, key, help in (
+        ("brawler_client_cpu_percent", "cpu_percent", "CPU used by the client"),
+        ("brawler_client_rss_bytes", "rss_bytes", "Resident memory of the client"),
+        (
+            "brawler_client_pss_bytes",
+            "pss_bytes",
+            "Proportional memory of the client",
+        ),
+        ("brawler_client_threads", "threads", "Threads of all client processes"),
+        ("brawler_client_processes", "processes", "Processes of the client"),
+        (
+            "brawler_client_read_bytes_per_second",
+            "read_bytes",
+            "Bytes the client read from storage",
+        ),
+        (
+            "brawler_client_write_bytes_per_second",
+            "write_bytes",
+            "Bytes the client wrote to storage",
+        ),
+    ):
+        values = [
+            ({"client": c}, t[key])
+            for c, t in telemetry.items()
+            if t.get(key) is not None
+        ]
+        if values:
+            metric(lines, name, "gauge", help, values)
+
+    return "\n".join(lines) + "\n"
+
+
+class metrics_writer:
+    # periodically rewrites a text file in prometheus format, e.g. for the
+    # node_exporter textfile collector
+
+    def __init__(self, path, stats, interval=5):
+        self.path = path
+        self.stats = stats
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics", daemon=True)
+
+    def start(self):
+        log.debug("writing metrics to {} every {}s".format(self.path, self.interval))
+        self.thread.start()
+
+    def write(self):
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, "w") as f:
+            f.write(render(self.stats()))
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                log.error("failed to write metrics: {}".format(e))
+
+    def stop(self):
+        self.stopped.set()
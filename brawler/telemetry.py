@@ -0,0 +1,222 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+import threading
+from collections import deque
+
+from brawler.logging import log
+
+TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# fields of /proc/<pid>/stat after the command name
+PPID, PGRP, SESSION, UTIME, STIME, THREADS, RSS = 1, 2, 3, 11, 12, 17, 21
+
+
+def read_proc():
+    # one pass over /proc: pid -> (command, ppid, pgrp, session, ticks, threads, rss)
+    procs = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry), "rb") as f:
+                data = f.read()
+            end = data.rindex(b")")
+            comm = data[data.index(b"(") + 1 : end]
+            stat = data[end + 2 :].split()
+            procs[int(entry)] = (
+                comm,
+                int(stat[PPID]),
+                int(stat[PGRP]),
+                int(stat[SESSION]),
+                int(stat[UTIME]) + int(stat[STIME]),
+                int(stat[THREADS]),
+                int(stat[RSS]) * PAGE_SIZE,
+            )
+        except (OSError, ValueError, IndexError):
+            continue
+    return procs
+
+
+def read_fields(path, fields):
+    # "name: value" files like /proc/<pid>/io and smaps_rollup
+    result = dict.fromkeys(fields, 0)
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                name, _, value = line.partition(b":")
+                name = name.decode()
+                if name in result:
+                    result[name] = int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+def server_dir(prefix):
+    # wineserver runs detached in /tmp/.wine-<uid>/server-<dev>-<inode>, named
+    # after the prefix directory, that's how it is matched to its client
+    try:
+        st = os.stat(prefix)
+    except OSError:
+        return None
+    return "server-{:x}-{:x}".format(st.st_dev, st.st_ino)
+
+
+class sampler:
+    # samples cpu, memory, threads and io of every client's wine processes:
+    # everything in its session or process group, their children and the
+    # wineserver of its prefix
+
+    def __init__(self, clients, interval=5, size=720, pss=False):
+        self.clients = clients
+        self.interval = interval
+        self.pss = pss
+        # the last samples, one dict per interval
+        self.samples = deque(maxlen=size)
+        self.previous = {}
+        self.last = None
+        self.servers = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+
+    def start(self):
+        log.debug("sampling client processes every {}s".format(self.interval))
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                log.error("failed to sample client processes: {}".format(e))
+
+    def stop(self):
+        self.stopped.set()
+
+    def members(self, procs, clients):
+        # pid -> client name
+        groups = {}
+        servers = {}
+        for c in clients:
+            if c.pgid is not None:
+                groups[c.pgid] = c.name
+            prefix = c.environment.get("WINEPREFIX")
+            if prefix is not None and prefix not in self.servers:
+                directory = server_dir(prefix)
+                if directory is not None:
+                    self.servers[prefix] = directory
+            if prefix in self.servers:
+                servers[self.servers[prefix]] = c.name
+
+        owner = {}
+        for pid, p in procs.items():
+            comm, ppid, pgrp, session = p[:4]
+            name = groups.get(session) or groups.get(pgrp)
+            if name is None and comm == b"wineserver":
+                try:
+                    cwd = os.readlink("/proc/{}/cwd".format(pid))
+                except OSError:
+                    cwd = ""
+                name = servers.get(os.path.basename(cwd))
+            if name is not None:
+                owner[pid] = name
+
+        # processes that left the session still belong to their parent's client
+        for pid in procs:
+            chain = []
+            p = pid
+            while p in procs and p not in owner and p > 1 and len(chain) < 64:
+                chain.append(p)
+                p = procs[p][1]
+            if p in owner:
+                for c in chain:
+                    owner[c] = owner[p]
+        return owner
+
+    def sample(self):
+        start = time.perf_counter()
+        now = time.monotonic()
+        clients = list(self.clients())
+        procs = read_proc()
+        owner = self.members(procs, clients)
+        elapsed = now - self.last if self.last is not None else None
+
+        totals = {
+            c.name: {
+                "processes": 0,
+                "threads": 0,
+                "cpu_percent": 0.0 if elapsed else None,
+                "rss_bytes": 0,
+                "read_bytes": 0,
+                "write_bytes": 0,
+            }
+            for c in clients
+        }
+        if self.pss:
+            for t in totals.values():
+                t["pss_bytes"] = 0
+
+        current = {}
+        for pid, name in owner.items():
+            if name not in totals:
+                continue
+            comm, ppid, pgrp, session, ticks, threads, rss = procs[pid]
+            io = read_fields("/proc/{}/io".format(pid), ("read_bytes", "write_bytes"))
+            current[pid] = (ticks, io["read_bytes"], io["write_bytes"])
+            # processes started since the last sample count from zero
+            before = self.previous.get(pid, (0, 0, 0))
+            t = totals[name]
+            t["processes"] += 1
+            t["threads"] += threads
+            t["rss_bytes"] += rss
+            t["read_bytes"] += max(current[pid][1] - before[1], 0)
+            t["write_bytes"] += max(current[pid][2] - before[2], 0)
+            if elapsed:
+                t["cpu_percent"] += max(ticks - before[0], 0) / TICKS / elapsed * 100
+            if self.pss:
+                t["pss_bytes"] += (
+                    read_fields("/proc/{}/smaps_rollup".format(pid), ("Pss",))["Pss"]
+                    * 1024
+                )
+
+        # io is reported as bytes per second over the last interval
+        for t in totals.values():
+            for key in ("read_bytes", "write_bytes"):
+                t[key] = t[key] / elapsed if elapsed else None
+
+        self.previous = current
+        self.last = now
+        sample = {
+            "time": time.time(),
+            "clients": totals,
+            "sample_seconds": time.perf_counter() - start,
+        }
+        self.samples.append(sample)
+        return sample
+
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def history(self, count=None):
+        samples = list(self.samples)
+        return samples if count is None else samples[-int(count) :]
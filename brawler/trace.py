@@ -0,0 +1,236 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import time
+import queue
+import struct
+import argparse
+import threading
+
+from brawler.stats import latency
+from brawler.logging import log
+
+# binary input trace: a header, then records that start with their type byte.
+# times are seconds since the trace started, keys are named once per trace.
+MAGIC = b"BRAWLTRC"
+VERSION = 1
+HEADER = struct.Struct("=8sHd")  # magic, version, wall clock start
+KEY = struct.Struct("=BIdBB")  # type, sequence, recorded, keycode, targets
+TARGET = struct.Struct("=HH")  # client id, key name, once per target
+NAME = struct.Struct("=BHB")  # type, key name, length of the name that follows
+SENT = struct.Struct("=BIHdd")  # type, sequence, client id, send start, send done
+DROP = struct.Struct("=BIH")  # type, sequence, client id
+KEY_RECORD, NAME_RECORD, SENT_RECORD, DROP_RECORD = 1, 2, 3, 4
+
+
+class trace_writer:
+    # the input path only puts tuples on a queue, packing and writing the
+    # records happens on the trace thread
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self.start = time.perf_counter()
+        self.names = {}
+        # only the listener thread numbers keys
+        self.seq = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="trace", daemon=True)
+        self.thread.start()
+        log.info("writing input trace to {}".format(path))
+
+    def key(self, keycode, recorded, targets):
+        self.seq += 1
+        self.queue.put((KEY_RECORD, self.seq, recorded, keycode, targets))
+        return self.seq
+
+    def sent(self, seq, client, start, done):
+        self.queue.put((SENT_RECORD, seq, client.id, start, done))
+
+    def dropped(self, seq, client):
+        self.queue.put((DROP_RECORD, seq, client.id))
+
+    def name(self, key_string):
+        if key_string not in self.names:
+            index = len(self.names)
+            self.names[key_string] = index
+            name = key_string.encode()
+            self.file.write(NAME.pack(NAME_RECORD, index, len(name)) + name)
+        return self.names[key_string]
+
+    def write(self, item):
+        kind = item[0]
+        if kind == KEY_RECORD:
+            kind, seq, recorded, keycode, targets = item
+            data = [KEY.pack(kind, seq, recorded - self.start, keycode, len(targets))]
+            for q, key_string in targets:
+                data.append(TARGET.pack(q.client.id, self.name(key_string)))
+            self.file.write(b"".join(data))
+        elif kind == SENT_RECORD:
+            kind, seq, client, start, done = item
+            self.file.write(
+                SENT.pack(kind, seq, client, start - self.start, done - self.start)
+            )
+        elif kind == DROP_RECORD:
+            self.file.write(DROP.pack(*item))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.write(item)
+                if self.queue.empty():
+                    self.file.flush()
+            except Exception as e:
+                log.error("failed to write input trace: {}".format(e))
+        self.file.close()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        log.info("input trace {} closed, {} keys".format(self.path, self.seq))
+
+
+def read(path):
+    # yields (KEY_RECORD, seq, time, keycode, [(client id, key)]),
+    # (SENT_RECORD, seq, client id, start, done) and (DROP_RECORD, seq, client id)
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, started = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} input trace".format(path, VERSION))
+    names = {}
+    offset = HEADER.size
+    while offset < len(data):
+        kind = data[offset]
+        if kind == NAME_RECORD:
+            kind, index, length = NAME.unpack_from(data, offset)
+            offset += NAME.size
+            names[index] = data[offset : offset + length].decode()
+            offset += length
+        elif kind == KEY_RECORD:
+            kind, seq, recorded, keycode, count = KEY.unpack_from(data, offset)
+            offset += KEY.size
+            targets = []
+            for i in range(count):
+                client, index = TARGET.unpack_from(data, offset)
+                targets.append((client, names[index]))
+                offset += TARGET.size
+            yield (kind, seq, recorded, keycode, targets)
+        elif kind == SENT_RECORD:
+            yield SENT.unpack_from(data, offset)
+            offset += SENT.size
+        elif kind == DROP_RECORD:
+            yield DROP.unpack_from(data, offset)
+            offset += DROP.size
+        else:
+            raise ValueError("unknown record {} at offset {}".format(kind, offset))
+
+
+def summary(path):
+    # keys, duration and per toon latency from recording to injection
+    keys = {}
+    clients = {}
+    for record in read(path):
+        if record[0] == KEY_RECORD:
+            keys[record[1]] = record[2]
+            continue
+        client = clients.setdefault(
+            record[2], {"latency": latency(size=None), "dropped": 0}
+        )
+        if record[0] == SENT_RECORD and record[1] in keys:
+            client["latency"].record(record[4] - keys[record[1]])
+        elif record[0] == DROP_RECORD:
+            client["dropped"] += 1
+    times = list(keys.values())
+    return {
+        "keys": len(keys),
+        "seconds": times[-1] - times[0] if times else 0.0,
+        "clients": {
+            "client_{}".format(id): {
+                "latency": c["latency"].summary(),
+                "dropped": c["dropped"],
+            }
+            for id, c in sorted(clients.items())
+        },
+    }
+
+
+def replay(dup, path, speed=1.0, targets=False):
+    # feed the recorded keycodes through the duplicator's current routing and
+    # send queues with the recorded timing, speed 0 replays without pauses.
+    # With targets every key goes to the toons it was recorded for instead.
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for record in read(path):
+        if record[0] != KEY_RECORD:
+            continue
+        if first is None:
+            first = record[2]
+        if speed:
+            delay = start + (record[2] - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if targets:
+            dup.duplicate_targets(record[3], time.perf_counter(), record[4])
+        else:
+            dup.duplicate_key(record[3], time.perf_counter())
+        count += 1
+    return count
+
+
+def print_summary(path):
+    result = summary(path)
+    print("{}: {} keys in {:.1f}s".format(path, result["keys"], result["seconds"]))
+    for name, c in result["clients"].items():
+        l = c["latency"]
+        print(
+            "{}: p50 {:.2f}ms, p95 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms, "
+            "{} dropped".format(
+                name,
+                l["p50"] * 1000,
+                l["p95"] * 1000,
+                l["p99"] * 1000,
+                l["max"] * 1000,
+                c["dropped"],
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show brawler input traces")
+    parser.add_argument("traces", help="trace files", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.traces:
+        try:
+            print_summary(path)
+        except (OSError, ValueError) as e:
+            print("can't read {}: {}".format(path, e), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,67 +18,369 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
+import threading
 from shlex import quote
+
+from Xlib import X, Xatom
+from Xlib.display import Display
+from Xlib.error import XError
+
 from brawler.process import execute
-from brawler.logging import log
+from brawler.logging import log, key_log
+
+# events on windows we watch, so we see new children, renames and destruction
+WATCH_MASK = X.StructureNotifyMask | X.SubstructureNotifyMask | X.PropertyChangeMask
+NAME_ATOMS = ("WM_NAME", "_NET_WM_NAME", "WM_CLASS", "_NET_CLIENT_LIST")
+
+
+class connection:
+    # one long lived connection per X display for all window operations,
+    # opened on first use, None is the display from the environment
+
+    def __init__(self, name=None):
+        self.name = name
+        self.disp = None
+        self.lock = threading.RLock()
+        # woken up by the event thread whenever a window appears, gets renamed or mapped
+        self.changed = threading.Condition(self.lock)
+        # bumped with every wakeup, so waiters notice changes they didn't wait for
+        self.generation = 0
+        # name -> window and (parent, name, class) -> child window caches, entries
+        # are dropped as soon as the window is destroyed
+        self.windows = {}
+        self.children = {}
+        # called from the event thread when the monitor configuration changed
+        self.screen_changed = []
+        self.randr = None
+
+    def open(self):
+        with self.lock:
+            if self.disp is None:
+                log.debug(
+                    "opening X connection {} for window operations".format(
+                        self.name or "default"
+                    )
+                )
+                self.disp = Display(self.name)
+                root = self.disp.screen().root
+                root.change_attributes(
+                    event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask
+                )
+                if self.disp.has_extension("RANDR"):
+                    from Xlib.ext import randr
+
+                    self.randr = self.disp.query_extension("RANDR").first_event
+                    root.xrandr_select_input(
+                        randr.RRScreenChangeNotifyMask
+                        | randr.RRCrtcChangeNotifyMask
+                        | randr.RROutputChangeNotifyMask
+                    )
+                self.disp.flush()
+                threading.Thread(
+                    target=self.listen,
+                    name="window_events_{}".format(self.name or "default"),
+                    daemon=True,
+                ).start()
+        return self.disp
+
+    def forget(self, window):
+        with self.lock:
+            for name, w in list(self.windows.items()):
+                if w == window:
+                    log.debug("window {} destroyed, dropping {}".format(window, name))
+                    del self.windows[name]
+            for key, w in list(self.children.items()):
+                if w == window or key[0] == window:
+                    del self.children[key]
+
+    def listen(self):
+        d = self.disp
+        name_atoms = [d.get_atom(a) for a in NAME_ATOMS]
+        while True:
+            try:
+                event = d.next_event()
+            except Exception as e:
+                log.error("window event thread stopped: {}".format(e))
+                return
+
+            if self.randr is not None and event.type in (self.randr, self.randr + 1):
+                # screen change or crtc/output change notify
+                for callback in list(self.screen_changed):
+                    try:
+                        callback()
+                    except Exception as e:
+                        log.error("screen change handler failed: {}".format(e))
+                continue
+            elif event.type == X.DestroyNotify:
+                self.forget(event.window.id)
+            elif event.type == X.CreateNotify:
+                # new windows don't have a name yet, so watch them for renames
+                try:
+                    event.window.change_attributes(event_mask=WATCH_MASK)
+                    d.flush()
+                except XError:
+                    continue
+            elif event.type == X.PropertyNotify:
+                if event.atom not in name_atoms:
+                    continue
+            elif event.type not in (X.MapNotify, X.ReparentNotify):
+                continue
+
+            with self.changed:
+                self.generation += 1
+                self.changed.notify_all()
+
+
+connections = {}
+connections_lock = threading.Lock()
+
+
+def window_id(window):
+    # window ids can still be strings when they come from the xdotool output
+    if isinstance(window, str):
+        return int(window, 0)
+    return int(window)
+
+
+def get_connection(display=None):
+    with connections_lock:
+        if display not in connections:
+            connections[display] = connection(display)
+        conn = connections[display]
+    conn.open()
+    return conn
+
+
+def on_screen_change(callback, display=None):
+    get_connection(display).screen_changed.append(callback)
+
+
+def get_display(display=None):
+    return get_connection(display).disp
+
+
+def get_root(display=None):
+    return get_display(display).screen().root
+
+
+def resource(window, display=None):
+    return get_display(display).create_resource_object("window", window_id(window))
+
+
+def flush(display=None):
+    # send all batched window requests at once, on every open display by default
+    if display is not None:
+        get_display(display).flush()
+        return
+    with connections_lock:
+        opened = [c.disp for c in connections.values() if c.disp is not None]
+    for d in opened:
+        d.flush()
+
+
+def watch(window, display=None):
+    resource(window, display).change_attributes(event_mask=WATCH_MASK)
+
+
+def wait_for(func, timeout=30, display=None):
+    # call func every time a window changed until it returns something, func
+    # runs without the lock so X round trips don't block the event thread
+    conn = get_connection(display)
+    deadline = time.monotonic() + timeout
+    while True:
+        with conn.changed:
+            generation = conn.generation
+        result = func()
+        if result is not None:
+            return result
+        with conn.changed:
+            while conn.generation == generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                conn.changed.wait(remaining)
+
+
+def wait_for_window(name, timeout=30, display=None):
+    return wait_for(lambda: get_window(name, display), timeout, display)
 
 
-def get_window(name):
+def wait_for_child_window(parent, name, wm_class=None, timeout=30, display=None):
+    return wait_for(
+        lambda: get_child_window(parent, name, wm_class, display), timeout, display
+    )
+
+
+def get_window_name(window):
+    try:
+        name = window.get_full_text_property(window.display.get_atom("_NET_WM_NAME"))
+        if not name:
+            name = window.get_wm_name()
+    except XError:
+        name = None
+    return name
+
+
+def matches(title, name):
+    # wine names the virtual desktop "<name> - Wine desktop"
+    return title is not None and (title == name or title.startswith(name + " "))
+
+
+def find_window(name, display=None):
+    queue = [get_root(display)]
+    while queue:
+        window = queue.pop(0)
+        try:
+            tree = window.query_tree()
+        except XError:
+            continue
+        for child in tree.children:
+            if matches(get_window_name(child), name):
+                return child.id
+            queue.append(child)
+    return None
+
+
+def get_window(name, display=None):
+    conn = get_connection(display)
+    with conn.lock:
+        if name in conn.windows:
+            return conn.windows[name]
+
     log.debug("searching for window: {}".format(name))
-    result = execute("xdotool search --name {}".format(quote(name)))
+    result = find_window(name, display)
     if result is not None:
-        result = result[0]
         log.debug("window found: {}".format(result))
+        with conn.lock:
+            conn.windows[name] = result
+        watch(result, display)
+        flush(display)
 
     return result
 
 
-def get_child_window(parent, name):
+def get_child_window(parent, name, wm_class=None, display=None):
+    parent = window_id(parent)
+    key = (parent, name, wm_class)
+    conn = get_connection(display)
+    with conn.lock:
+        if key in conn.children:
+            return conn.children[key]
+
     log.debug("trying to find child window for {} {}".format(parent, name))
-    result = execute(
-        "xwininfo -children -id {} | grep {}".format(quote(parent), quote(name))
-    )
+    result = None
+    try:
+        tree = resource(parent, display).query_tree()
+    except XError:
+        return None
+
+    for child in tree.children:
+        try:
+            if get_window_name(child) != name:
+                continue
+            if wm_class is not None and child.get_wm_class() != wm_class:
+                continue
+        except XError:
+            continue
+        result = child.id
+        break
 
     if result is not None:
-        result = result[0]
         log.debug("window for parent {} found: {}".format(parent, result))
+        with conn.lock:
+            conn.children[key] = result
+        watch(result, display)
+        flush(display)
     return result
 
 
-def windowsize(window, resolution_x, resolution_y):
-    log.debug("changing window size: {}x{}".format(resolution_x, resolution_y))
-    execute(
-        "xdotool windowsize {} {} {}".format(
-            quote(window), int(resolution_x), int(resolution_y)
+def is_drawn(window, size=32, display=None):
+    # a window still showing a plain background has a single colour, once the
+    # game draws something the sampled area in the centre isn't uniform anymore
+    try:
+        w = resource(window, display)
+        geometry = w.get_geometry()
+        x = max(int(geometry.width / 2 - size / 2), 0)
+        y = max(int(geometry.height / 2 - size / 2), 0)
+        image = w.get_image(
+            x,
+            y,
+            min(size, geometry.width),
+            min(size, geometry.height),
+            X.ZPixmap,
+            0xFFFFFFFF,
         )
+    except XError:
+        return False
+    data = image.data
+    bpp = 4 if len(data) >= 4 else 1
+    return len(set(data[i : i + bpp] for i in range(0, len(data), bpp))) > 1
+
+
+def wait_until_drawn(window, timeout=60, step=0.25, display=None):
+    # there is no event for the window contents changing, so sample it
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_drawn(window, display=display):
+            return window
+        time.sleep(step)
+    return None
+
+
+def windowsize(window, resolution_x, resolution_y, display=None):
+    log.debug("changing window size: {}x{}".format(resolution_x, resolution_y))
+    resource(window, display).configure(
+        width=int(resolution_x), height=int(resolution_y)
     )
 
 
-def windowmove(window, position_x, position_y):
+def windowmove(window, position_x, position_y, display=None):
     log.debug("moving window to position: {} {}".format(position_x, position_y))
-    execute(
-        "xdotool windowmove {} {} {}".format(
-            quote(window), int(position_x), int(position_y)
-        )
-    )
+    resource(window, display).configure(x=int(position_x), y=int(position_y))
 
 
-def undecorate(window):
+def undecorate(window, display=None):
     log.debug("trying to undecorate window {}".format(window))
+    d = get_display(display)
+    resource(window, display).change_property(
+        d.get_atom("_MOTIF_WM_HINTS"), Xatom.CARDINAL, 32, [0x2, 0x0, 0x0, 0x0, 0x0]
+    )
+
+
+def xdotool(display=None):
+    # xdotool only takes the display from the environment
+    if display is None:
+        return "xdotool"
+    return "DISPLAY={} xdotool".format(quote(display))
+
+
+def send_key(window, key, display=None):
+    key_log.debug("send key %s to window: %s", key, window)
     execute(
-        "xprop -id {} -f _MOTIF_WM_HINTS 32c -set _MOTIF_WM_HINTS '0x2, 0x0, 0x0, 0x0, 0x0'".format(
-            quote(window)
-        )
+        "{} key --window {} {}".format(xdotool(display), quote(str(window)), quote(key))
     )
 
 
-def send_key(window, key):
-    log.debug("send key {} to window: {}".format(key, window))
-    execute("xdotool key --window {} {}".format(quote(window), key))
+def send_keys(window, keys, display=None):
+    key_log.debug("send keys to window: %s", window)
+    execute(
+        "{} key --window {} {}".format(
+            xdotool(display), quote(str(window)), " ".join(quote(k) for k in keys)
+        )
+    )
 
 
-def get_window_pid(window):
+def get_window_pid(window, display=None):
+    # the game window may not exist yet right after boot
+    if window is None:
+        return None
     log.debug("trying to find pid for window {}".format(window))
-    result = execute("xprop -id {} _NET_WM_PID".format(window))
-    if len(result) > 2:
-        return int(result[2])
+    try:
+        prop = resource(window, display).get_full_property(
+            get_display(display).get_atom("_NET_WM_PID"), Xatom.CARDINAL
+        )
+    except XError:
+        prop = None
+    if prop is not None and len(prop.value) > 0:
+        return int(prop.value[0])
@@ -15,5 +15,11 @@ setup(
     install_requires=requirements,
     packages=find_packages(),
     include_package_data=True,
-    entry_points={"console_scripts": ["brawler=brawler:main"]},
+    entry_points={
+        "console_scripts": [
+            "brawler=brawler:main",
+            "brawler-ctl=brawler.ctl:main",
+            "brawler-trace=brawler.trace:main",
+        ]
+    },
 )
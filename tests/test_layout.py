@@ -0,0 +1,85 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from brawler import layout
+
+
+def monitor(x, width, height, primary=False):
+    return (x, 0, width, height, primary)
+
+
+def test_split_covers_length_without_gaps():
+    parts = layout.split(10, 100, 3)
+    assert parts == [(10, 33), (43, 33), (76, 34)]
+    assert sum(length for start, length in parts) == 100
+
+
+def test_distribute_follows_area():
+    regions = [(0, 0, 100, 100), (100, 0, 300, 100)]
+    assert layout.distribute(regions, 4) == [1, 3]
+    assert layout.distribute(regions, 3) == [1, 2]
+    assert sum(layout.distribute(regions, 7)) == 7
+
+
+def test_compute_master_and_strip():
+    tiles = layout.compute((monitor(0, 1920, 1080, True),), 4, panel=28)
+    assert tiles[0] == (0, 1402, 1052, 0, 0)
+    assert [t[0] for t in tiles] == [0, 1, 2, 3, 4]
+    for id, w, h, x, y in tiles[1:]:
+        assert (w, x) == (518, 1402)
+
+
+@pytest.mark.parametrize("width,height", [(1440, 1080), (1280, 1024)])
+def test_compute_narrow_monitor_shrinks_master(width, height):
+    tiles = layout.compute((monitor(0, width, height, True),), 4, panel=28)
+    master = tiles[0]
+    assert master[1] == width - layout.MIN_TOON_WIDTH
+    for id, w, h, x, y in tiles[1:]:
+        assert w >= layout.MIN_TOON_WIDTH
+        assert x >= master[1]
+
+
+def test_compute_narrow_strip_moves_toons_to_other_monitors():
+    monitors = (monitor(0, 1440, 1080, True), monitor(1440, 1920, 1080))
+    tiles = layout.compute(monitors, 4, panel=28)
+    assert tiles[0] == (0, 1402, 1052, 0, 0)
+    for id, w, h, x, y in tiles[1:]:
+        assert x >= 1440
+
+
+def test_compute_fill_single_monitor_falls_back_to_aspect():
+    tiles = layout.compute((monitor(0, 1920, 1080, True),), 2, aspect=None)
+    assert tiles[0][1] == int(1080 * layout.ASPECT)
+
+
+def test_compute_fill_dual_monitor():
+    monitors = (monitor(0, 1920, 1080, True), monitor(1920, 1920, 1080))
+    tiles = layout.compute(monitors, 4, "columns", None)
+    assert tiles[0] == (0, 1920, 1080, 0, 0)
+    assert len(tiles) == 5
+    for id, w, h, x, y in tiles[1:]:
+        assert (w, h) == (960, 540)
+
+
+def test_compute_rejects_unknown_preset():
+    with pytest.raises(ValueError):
+        layout.compute((monitor(0, 1920, 1080, True),), 1, "spiral")
@@ -0,0 +1,90 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from types import SimpleNamespace
+
+from brawler.routing import routing
+
+PROFILES = {
+    "healer": {"remap": {"1": "9"}, "groups": ["heal"]},
+    "dps": {"groups": ["dps"]},
+}
+KEY_GROUPS = {"2": ["heal"]}
+
+
+def table():
+    table = [None] * 256
+    table[10] = "1"
+    table[11] = "2"
+    table[12] = "3"
+    return table
+
+
+def queues(*ids):
+    return [SimpleNamespace(client=SimpleNamespace(id=id)) for id in ids]
+
+
+def targets(routes, keycode):
+    return [(q.client.id, key) for q, key in routes[keycode] or ()]
+
+
+def test_remap_and_key_groups():
+    r = routing(PROFILES, ["healer", "dps"], KEY_GROUPS)
+    routes = r.compile(table(), queues(1, 2, 3))
+    assert targets(routes, 10) == [(1, "9"), (2, "1"), (3, "1")]
+    # only healers get key 2, toons without a profile don't either
+    assert targets(routes, 11) == [(1, "2")]
+    assert targets(routes, 12) == [(1, "3"), (2, "3"), (3, "3")]
+    assert routes[13] is None
+
+
+def test_removed_toon_keeps_later_profiles():
+    r = routing(PROFILES, ["dps", "healer", "healer"], KEY_GROUPS)
+    r.compile(table(), queues(1, 2, 3))
+    routes = r.compile(table(), queues(1, 3))
+    assert targets(routes, 10) == [(1, "1"), (3, "9")]
+    # a new toon gets the position that became free
+    routes = r.compile(table(), queues(1, 3, 4))
+    assert targets(routes, 10) == [(1, "1"), (3, "9"), (4, "9")]
+
+
+def test_replacement_inherits_pin():
+    r = routing(PROFILES, ["dps", "healer"], KEY_GROUPS)
+    old, other = queues(1, 2)
+    r.compile(table(), [old, other])
+    new = queues(7)[0]
+    r.replace(old.client, new.client)
+    routes = r.compile(table(), [other, new])
+    assert targets(routes, 10) == [(2, "9"), (7, "1")]
+
+
+def test_skips_toons_without_queue():
+    r = routing(PROFILES, ["healer"], KEY_GROUPS)
+    routes = r.compile(table(), [None] + queues(2))
+    assert targets(routes, 10) == [(2, "9")]
+
+
+def test_keep_pins_across_reload():
+    r = routing(PROFILES, ["dps", "healer", "healer"], KEY_GROUPS)
+    r.compile(table(), queues(1, 2, 3))
+    reloaded = routing(PROFILES, ["healer", "dps", "dps"], KEY_GROUPS)
+    reloaded.keep(r)
+    routes = reloaded.compile(table(), queues(1, 3))
+    assert targets(routes, 10) == [(1, "9"), (3, "1")]
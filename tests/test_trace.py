@@ -0,0 +1,95 @@
+# Copyright (c) 2022 Daniel Schmitz
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from types import SimpleNamespace
+
+import pytest
+
+from brawler import trace
+
+
+def client(id):
+    return SimpleNamespace(id=id, name="client_{}".format(id))
+
+
+def write(path):
+    writer = trace.trace_writer(str(path))
+    t = writer.start
+    first, second = client(1), client(2)
+    targets = [
+        (SimpleNamespace(client=first), "1"),
+        (SimpleNamespace(client=second), "9"),
+    ]
+    seq = writer.key(10, t + 0.5, targets)
+    writer.sent(seq, first, t + 0.501, t + 0.502)
+    writer.dropped(seq, second)
+    # the key names are only written once
+    seq = writer.key(10, t + 1.5, targets)
+    writer.sent(seq, first, t + 1.5, t + 1.504)
+    writer.sent(seq, second, t + 1.5, t + 1.506)
+    writer.close()
+    writer.thread.join()
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "input.trace"
+    write(path)
+    records = list(trace.read(str(path)))
+    assert [r[0] for r in records] == [
+        trace.KEY_RECORD,
+        trace.SENT_RECORD,
+        trace.DROP_RECORD,
+        trace.KEY_RECORD,
+        trace.SENT_RECORD,
+        trace.SENT_RECORD,
+    ]
+    kind, seq, recorded, keycode, targets = records[0]
+    assert (seq, keycode, targets) == (1, 10, [(1, "1"), (2, "9")])
+    assert recorded == pytest.approx(0.5)
+    assert records[1][:3] == (trace.SENT_RECORD, 1, 1)
+    assert records[1][4] == pytest.approx(0.502)
+    assert records[2] == (trace.DROP_RECORD, 1, 2)
+    assert records[3][4] == [(1, "1"), (2, "9")]
+
+
+def test_summary(tmp_path):
+    path = tmp_path / "input.trace"
+    write(path)
+    result = trace.summary(str(path))
+    assert result["keys"] == 2
+    assert result["seconds"] == pytest.approx(1.0)
+    first = result["clients"]["client_1"]
+    assert first["dropped"] == 0
+    assert first["latency"]["count"] == 2
+    assert first["latency"]["max"] == pytest.approx(0.004)
+    second = result["clients"]["client_2"]
+    assert second["dropped"] == 1
+    assert second["latency"]["count"] == 1
+    assert second["latency"]["max"] == pytest.approx(0.006)
+
+
+def test_read_rejects_bad_header(tmp_path):
+    path = tmp_path / "input.trace"
+    path.write_bytes(trace.HEADER.pack(b"NOTATRCE", trace.VERSION, 0.0))
+    with pytest.raises(ValueError):
+        list(trace.read(str(path)))
+    path.write_bytes(trace.HEADER.pack(trace.MAGIC, trace.VERSION + 1, 0.0))
+    with pytest.raises(ValueError):
+        list(trace.read(str(path)))